@@ -0,0 +1,202 @@
+import asyncio
+import gc
+import threading
+import time
+from typing import Any
+
+from fiit_docgen.ai_requester import AIRequester, AsyncAIRequester, DocLineParser, JsonDocParser
+from fiit_docgen.records import Position, PosWithBody, PosWithDoc, RequestBody
+from fiit_docgen.transport import Transport, TransportResponse
+
+
+class FakeAsyncRequester(AsyncAIRequester):
+    def __init__(self, objects_to_doc: dict[str, PosWithBody], concurrency: int) -> None:
+        super().__init__(objects_to_doc, max_batch_tokens=1, concurrency=concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self._lock:
+            self.in_flight -= 1
+        name = body["contents"][1]["parts"][0]["text"].split()[1].split("(")[0]
+        return f"{name}: Doc of {name}"
+
+
+def _objects(count: int) -> dict[str, PosWithBody]:
+    return {
+        f"a.py/f{i}": PosWithBody(Position(i * 2, 0, i * 2 + 2), [f"def f{i}():\n", "    pass\n"]) for i in range(count)
+    }
+
+
+def test_async_requester_limits_concurrency() -> None:
+    # Запросы выполняются параллельно, но не больше заданного количества одновременно
+    requester = FakeAsyncRequester(_objects(8), concurrency=3)
+    assert requester.batches_length == 8
+
+    docs = requester.get_docs()
+    assert requester.max_in_flight == 3
+    assert len(docs) == 8
+    assert docs["a.py/f5"].Documentation == "Doc of f5"
+
+
+def test_async_requester_stopped_early_retrieves_result_of_requests() -> None:
+    # Если потребитель прекратил чтение, запросы отменяются без ошибки "exception was never retrieved"
+    errors: list[str] = []
+
+    async def consume_first() -> None:
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context["message"]))
+        docs = FakeAsyncRequester(_objects(8), concurrency=3).iter_docs()
+        async for _ in docs:
+            break
+        await docs.aclose()
+        await asyncio.sleep(0.1)
+        gc.collect()
+        await asyncio.sleep(0)
+
+    asyncio.run(consume_first())
+    assert errors == []
+
+
+class ScriptedRequester(AIRequester):
+    def __init__(self, objects_to_doc: dict[str, PosWithBody], answers: list[str | None]) -> None:
+        super().__init__(objects_to_doc)
+        self.answers = answers
+        self.requests: list[RequestBody] = []
+
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
+        self.requests.append(body)
+        return self.answers[len(self.requests) - 1]
+
+
+def _class_objects() -> dict[str, PosWithBody]:
+    return {
+        "a.py/A": PosWithBody(Position(0, 0, 5), ["class A:\n", "    def run(self):\n", "        pass\n"]),
+        "a.py/A/run": PosWithBody(Position(1, 4, 5), ["    def run(self):\n", "        pass\n"]),
+        "a.py/f": PosWithBody(Position(5, 0, 7), ["def f(x):\n", "    return x\n"]),
+    }
+
+
+def test_get_docs_stops_on_success() -> None:
+    # При успешном ответе повторных запросов нет
+    requester = ScriptedRequester(_class_objects(), ["A: Class\nA/run: Runs\nf: Identity\nf/param x: value"])
+    docs = requester.get_docs()
+    assert len(requester.requests) == 1
+    assert docs["a.py/f"].Documentation == "Identity\n:param x: value"
+
+
+def test_get_docs_requests_only_missing_objects() -> None:
+    # Принятые объекты сохраняются, повторно запрашивается только код недостающих
+    requester = ScriptedRequester(_class_objects(), ["A: Class\nf/param x: value\nf: Identity", None, "A/run: Runs"])
+    docs = requester.get_docs()
+
+    assert len(requester.requests) == 3
+    assert [part["text"] for part in requester.requests[1]["contents"][1]["parts"]] == [
+        "    def run(self):\n        pass\n"
+    ]
+    assert docs["a.py/A"].Documentation == "Class"
+    assert docs["a.py/A/run"].Documentation == "Runs"
+    assert docs["a.py/f"].Documentation == "Identity"
+
+
+def test_doc_line_parser_completes_objects_while_streaming() -> None:
+    # Документация объекта готова, как только началась строка следующего объекта, даже если строки разбиты на части
+    parser = DocLineParser(_class_objects())
+    assert parser.feed("A: Cla") == []
+    assert parser.feed("ss\nA/run: Ru") == []
+    assert [key for key, _ in parser.feed("ns\nf: Identity\nf/param x: va")] == ["a.py/A", "a.py/A/run"]
+    assert parser.feed("lue") == []
+    completed = parser.close()
+    assert [(key, doc.Documentation) for key, doc in completed] == [("a.py/f", "Identity\n:param x: value")]
+
+
+def test_json_doc_parser_decodes_elements_while_streaming() -> None:
+    # В режиме JSON каждый элемент массива разбирается, как только он получен целиком, неполный элемент отбрасывается
+    parser = JsonDocParser(_class_objects())
+    assert parser.feed('[{"path": "A/run", "descr') == []
+    completed = parser.feed('iption": "Runs"},\n {"path": "f", "description": "Identity", "params": [{"name": "x", ')
+    assert [key for key, _ in completed] == ["a.py/A/run"]
+    completed = parser.feed('"description": "value"}], "return": "x"}, {"path": "A"')
+    assert [(key, doc.Documentation) for key, doc in completed] == [("a.py/f", "Identity\n:param x: value\n:return: x")]
+    assert parser.close() == []
+    assert set(parser.result) == {"a.py/A/run", "a.py/f"}
+
+
+class StreamTransport(Transport):
+    def __init__(self, chunks: list[str]) -> None:
+        self.chunks = chunks
+        self.urls: list[str] = []
+
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        raise AssertionError("Streaming requester must not wait for whole answer")
+
+    def stream(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        self.urls.append(url)
+        events = [{"candidates": [{"content": {"parts": [{"text": chunk}]}}]} for chunk in self.chunks]
+        return TransportResponse(200, iter([*events, {"candidates": [{"finishReason": "STOP"}]}]))
+
+
+def test_async_requester_streams_docs_of_objects() -> None:
+    # В режиме потока документация отдается по объектам, а не одним словарем на весь батч
+    transport = StreamTransport(["A: Class\nA/run: Runs\n", "f: Identity\nf/param x: value"])
+    requester = AsyncAIRequester(_class_objects(), transport=transport, stream=True)
+
+    async def collect() -> list[dict[str, PosWithDoc]]:
+        return [docs async for docs in requester.iter_docs()]
+
+    received = asyncio.run(collect())
+    assert [list(docs) for docs in received] == [["a.py/A"], ["a.py/A/run"], ["a.py/f"]]
+    assert received[2]["a.py/f"].Documentation == "Identity\n:param x: value"
+    assert len(transport.urls) == 1 and ":streamGenerateContent?alt=sse" in transport.urls[0]
+
+
+def test_validate_docs_resolves_ambiguous_names() -> None:
+    # Одинаковые имена в разных классах и файлах распределяются по порядку, суффикс имени не совпадает с другим объектом
+    objects = {
+        "/p/a.py/A": PosWithBody(Position(0, 0, 3)),
+        "/p/a.py/A/run": PosWithBody(Position(1, 4, 3)),
+        "/p/a.py/B": PosWithBody(Position(3, 0, 6)),
+        "/p/a.py/B/run": PosWithBody(Position(4, 4, 6)),
+        "/p/a.py/un": PosWithBody(Position(6, 0, 8)),
+        "/p/b.py/un": PosWithBody(Position(0, 0, 2)),
+    }
+    answer = (
+        "A: Class A\nrun: First\nrun/param x: value\nB/run: Second\nrun: Again\nun: Function\nB: Class B\nun: Other"
+    )
+    docs = AIRequester(objects)._validate_docs(answer, objects)
+
+    assert docs is not None
+    assert {key: doc.Documentation for key, doc in docs.items()} == {
+        "/p/a.py/A": "Class A",
+        "/p/a.py/A/run": "Again",
+        "/p/a.py/B": "Class B",
+        "/p/a.py/B/run": "Second",
+        "/p/a.py/un": "Function",
+        "/p/b.py/un": "Other",
+    }
+
+
+def test_get_docs_sends_one_copy_of_duplicated_code() -> None:
+    # Код, совпадающий с точностью до пробелов, отправляется один раз, документация копируется во все файлы
+    objects = {
+        "a.py/A": PosWithBody(Position(0, 0, 3), ["class A:\n", "    def run(self):\n", "        pass\n"]),
+        "a.py/A/run": PosWithBody(Position(1, 4, 3), ["    def run(self):\n", "        pass\n"]),
+        "b.py/A": PosWithBody(Position(5, 0, 9), ["class A:\n", "\n", "    def run(self):   \n", "        pass\n"]),
+        "b.py/A/run": PosWithBody(Position(7, 4, 9), ["    def run(self):   \n", "        pass\n"]),
+        "b.py/f": PosWithBody(Position(0, 0, 2), ["def f(x):\n", "    return x\n"]),
+    }
+    requester = ScriptedRequester(objects, ["A: Class\nA/run: Runs\nf: Identity"])
+    assert requester.duplicates_length == 2
+
+    docs = requester.get_docs()
+    assert [part["text"] for part in requester.requests[0]["contents"][1]["parts"]] == [
+        "class A:\n    def run(self):\n        pass\n",
+        "def f(x):\n    return x\n",
+    ]
+    assert docs["b.py/A/run"].Documentation == "Runs"
+    assert docs["b.py/A/run"].Position == Position(7, 4, 9)
+    assert len(docs) == 5
@@ -0,0 +1,77 @@
+import threading
+from pathlib import Path
+from typing import Iterator
+
+from benchmarks.corpus import write_corpus
+from benchmarks.mock_server import MockGemini
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.backends import Backend, HedgedBackend, OpenAIBackend
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.project import parse_files
+from fiit_docgen.records import RequestBody
+from fiit_docgen.transport import HttpTransport
+
+
+class FakeBackend(Backend):
+    def __init__(self, text: str, release: threading.Event | None = None) -> None:
+        self.text = text
+        self.release = release
+        self.requests = 0
+
+    def generate(self, body: RequestBody) -> str | None:
+        self.requests += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return self.text
+
+    def stream(self, body: RequestBody) -> Iterator[str] | None:
+        return iter([self.text])
+
+
+def test_openai_backend_documents_every_object(tmp_path: Path) -> None:
+    # OpenAI-совместимый бэкенд (замена локального сервера) документирует все объекты, в том числе потоком
+    objects = parse_files(write_corpus(tmp_path, files=1, functions=20), jobs=1).objects
+    with MockGemini() as mock:
+        backend = OpenAIBackend(mock.openai_url, "local", "", HttpTransport(mock.openai_url))
+        docs = AIRequester(objects, backend=backend, max_batch_tokens=500).get_docs()
+        streamed = AIRequester(objects, backend=backend, max_batch_tokens=500, stream=True).get_docs()
+        backend.close()
+    assert docs.keys() == objects.keys()
+    assert streamed == docs
+
+
+def test_json_output_is_decoded_by_every_backend(tmp_path: Path) -> None:
+    # Ответ в режиме JSON по схеме разбирается в ту же документацию, что и текстовый ответ
+    objects = parse_files(write_corpus(tmp_path, files=1, functions=20), jobs=1).objects
+    with MockGemini() as mock:
+        text = AIRequester(objects, url=mock.url).get_docs()
+        gemini = AIRequester(objects, url=mock.url, json_output=True, stream=True).get_docs()
+        backend = OpenAIBackend(mock.openai_url, "local", "", HttpTransport(mock.openai_url))
+        requester = AIRequester(objects, backend=backend, json_output=True)
+        body = requester._batches[0].body
+        assert backend._convert(body)["response_format"]["json_schema"]["schema"]["type"] == "array"
+        openai = requester.get_docs()
+        backend.close()
+    assert gemini == text
+    assert openai == text
+
+
+def test_hedged_backend_takes_first_answer() -> None:
+    # Если основной бэкенд не ответил до дедлайна, запрос повторяется на втором и берется первый ответ
+    release = threading.Event()
+    primary, secondary = FakeBackend("primary", release), FakeBackend("secondary")
+    metrics = Metrics()
+    hedged = HedgedBackend(primary, secondary, initial_deadline=0.01, metrics=metrics)
+    assert hedged.generate({}) == "secondary"
+    assert metrics.counter("hedged_requests") == 1 and metrics.counter("hedge_wins") == 1
+    release.set()
+
+    ticks = iter(range(100))
+    fast = HedgedBackend(FakeBackend("primary"), secondary, min_samples=3, clock=lambda: next(ticks))
+    assert fast.deadline() is None
+    for _ in range(3):
+        assert fast.generate({}) == "primary"
+    assert fast.deadline() == 1
+    assert secondary.requests == 1
+    hedged.close()
+    fast.close()
@@ -0,0 +1,52 @@
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.batcher import Batcher, estimate_tokens
+from fiit_docgen.records import Position, PosWithBody, RequestBody
+
+
+class FakeRequester(AIRequester):
+    ANSWERS = {
+        "def first():\n    pass\n": "first: First function\nfirst/return: nothing",
+        "class Second:\n    def method(self):\n        pass\n": "Second: Second class\nSecond/method: Method",
+    }
+
+    def __init__(self, objects_to_doc: dict[str, PosWithBody], max_batch_tokens: int) -> None:
+        super().__init__(objects_to_doc, max_batch_tokens=max_batch_tokens)
+        self.requests: list[RequestBody] = []
+
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
+        self.requests.append(body)
+        return "\n".join(self.ANSWERS[part["text"]] for part in body["contents"][1]["parts"])
+
+
+def _objects() -> dict[str, PosWithBody]:
+    return {
+        "a.py/first": PosWithBody(Position(0, 0, 2), ["def first():\n", "    pass\n"]),
+        "a.py/Second": PosWithBody(Position(2, 0, 5), ["class Second:\n", "    def method(self):\n", "        pass\n"]),
+        "a.py/Second/method": PosWithBody(Position(3, 4, 5), ["    def method(self):\n", "        pass\n"]),
+    }
+
+
+def test_estimate_tokens() -> None:
+    # Оценка количества токенов по размеру текста
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("a" * 400) == 101
+
+
+def test_split_under_budget() -> None:
+    # Объекты делятся на батчи по бюджету, слишком большой объект получает отдельный батч
+    bodies = {"a": "x" * 40, "b": "x" * 40, "c": "x" * 400, "d": "x" * 4}
+    assert Batcher(max_tokens=30).split(bodies) == [["a", "b"], ["c"], ["d"]]
+    assert Batcher(max_tokens=1000).split(bodies) == [["a", "b", "c", "d"]]
+    assert Batcher().split({}) == []
+
+
+def test_requester_merges_batches() -> None:
+    # Класс отправляется вместе со своими методами, результаты батчей объединяются
+    requester = FakeRequester(_objects(), max_batch_tokens=10)
+    assert requester.batches_length == 2
+
+    docs = requester.get_docs()
+    assert set(docs) == {"a.py/first", "a.py/Second", "a.py/Second/method"}
+    assert docs["a.py/first"].Documentation == "First function\n:return: nothing"
+    assert docs["a.py/Second/method"].Position == Position(3, 4, 5)
+    assert all(len(body["contents"][1]["parts"]) == 1 for body in requester.requests)
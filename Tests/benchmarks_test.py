@@ -0,0 +1,32 @@
+from pathlib import Path
+
+import pytest
+from benchmarks.corpus import write_corpus
+from benchmarks.mock_server import MockGemini
+from benchmarks.run import compare, run_benchmarks
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.project import parse_files
+
+
+def test_mock_gemini_documents_every_object(tmp_path: Path) -> None:
+    # Локальная замена Gemini возвращает документацию для всех объектов синтетического кода
+    objects = parse_files(write_corpus(tmp_path, files=2, functions=40), jobs=1).objects
+    with MockGemini() as mock:
+        docs = AIRequester(objects, url=mock.url, max_batch_tokens=500).get_docs()
+        streamed = AIRequester(objects, url=mock.url, max_batch_tokens=500, stream=True).get_docs()
+        assert mock.requests > 2
+    assert docs.keys() == objects.keys()
+    assert streamed == docs
+    assert all(doc.Documentation.startswith("Generated documentation") for doc in docs.values())
+
+
+def test_run_benchmarks_report(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Отчет содержит все замеры, замедление сверх допуска считается регрессией
+    monkeypatch.chdir(tmp_path)
+    results = run_benchmarks(tmp_path, functions=50, files=2, latency=0.0, repeat=1, validate_objects=20)
+    assert set(results) == {"parse_ast", "parse_regex", "process_files", "validate_docs", "docgen_run"}
+    assert results["docgen_run"]["requests"] >= 1
+
+    slower = {name: {**result, "seconds": result["seconds"] * 2 + 1} for name, result in results.items()}
+    assert compare(results, results, 0.2) == []
+    assert len(compare(slower, results, 0.2)) == 5
@@ -0,0 +1,80 @@
+import time
+from pathlib import Path
+
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.cache import DocCache, fingerprint
+from fiit_docgen.records import Position, PosWithBody, RequestBody
+
+
+class FakeRequester(AIRequester):
+    def __init__(self, objects_to_doc: dict[str, PosWithBody], cache: DocCache, answer: str) -> None:
+        super().__init__(objects_to_doc, cache=cache)
+        self.answer = answer
+        self.calls = 0
+
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
+        self.calls += 1
+        return self.answer
+
+
+def _objects() -> dict[str, PosWithBody]:
+    return {
+        "a.py/A": PosWithBody(Position(0, 0, 4), ["class A:\n", "    def run(self):\n", "        pass\n"]),
+        "a.py/A/run": PosWithBody(Position(1, 4, 4), ["    def run(self):\n", "        pass\n"]),
+    }
+
+
+def test_fingerprint_ignores_formatting() -> None:
+    # Отступы и пустые строки не влияют на ключ
+    assert fingerprint("    def f():\n\n        pass  \n") == fingerprint("def f():\n    pass\n")
+    assert fingerprint("def f():\n    pass\n") != fingerprint("def f():\n    return 1\n")
+
+
+def test_cache_put_get_and_eviction(tmp_path: Path) -> None:
+    # Запись, чтение и вытеснение самых старых записей
+    cache = DocCache(tmp_path, max_entries=2)
+    cache.put("k1", {"": "doc1"})
+    time.sleep(0.01)
+    cache.put("k2", {"": "doc2"})
+    time.sleep(0.01)
+    cache.put("k3", {"": "doc3"})
+    cache.evict()
+    assert cache.get("k1") is None
+    assert cache.get("k3") == {"": "doc3"}
+    assert len(cache) == 2
+    cache.close()
+
+    cache = DocCache(tmp_path, max_age_days=0)
+    assert len(cache) == 0
+
+
+def test_requester_uses_cache(tmp_path: Path) -> None:
+    # Повторный запуск берет документацию из кэша и не обращается к AI
+    answer = "A: Runner class\nA/run: Runs\nA/run/return: nothing"
+    cache = DocCache(tmp_path)
+    first = FakeRequester(_objects(), cache, answer)
+    docs = first.get_docs()
+    assert first.calls > 0
+
+    second = FakeRequester(_objects(), cache, "")
+    assert second.cached_length == 2
+    assert second.get_docs() == docs
+    assert second.calls == 0
+    cache.close()
+
+
+def test_refreshed_cache_is_not_read_but_updated(tmp_path: Path) -> None:
+    # При регенерации документация из кэша не берется, а заменяется новой
+    cache = DocCache(tmp_path)
+    FakeRequester(_objects(), cache, "A: Old class\nA/run: Old").get_docs()
+    cache.close()
+
+    refreshed = DocCache(tmp_path, refresh=True)
+    requester = FakeRequester(_objects(), refreshed, "A: New class\nA/run: New")
+    assert requester.cached_length == 0
+    assert requester.get_docs()["a.py/A/run"].Documentation == "New"
+    refreshed.close()
+
+    cache = DocCache(tmp_path)
+    assert FakeRequester(_objects(), cache, "").get_docs()["a.py/A"].Documentation == "New class"
+    cache.close()
@@ -1,7 +1,11 @@
+import ast
+import os
 from pathlib import Path
 
-from fiit_docgen.code_changer import CodeChanger
-from fiit_docgen.records import Position, PosWithDoc
+import pytest
+from fiit_docgen.code_changer import CodeChanger, DefinitionIndex
+from fiit_docgen.parser import AstParser, Parser
+from fiit_docgen.records import Definition, Edit, Position, PosWithDoc
 
 
 def test_convert_ai_data() -> None:
@@ -139,3 +143,200 @@ def test_find_end_of_definition_class() -> None:
     changer = CodeChanger()
     end = changer._find_end_of_definition(lines, 0)
     assert end == 0
+
+
+def test_group_by_files_absolute_paths() -> None:
+    # Ключи с абсолютными путями группируются по файлу, а не по первому компоненту пути
+    ai_data = {
+        "/project/pkg/a.py/Class1/method": (Position(5, 4), "Docs for method"),
+        "/project/pkg/a.py/Class1": (Position(3, 0), "Docs for Class1"),
+        "/project/pkg/b.py/func": (Position(0, 0), "Docs for func"),
+    }
+    grouped = CodeChanger()._group_by_files(ai_data)
+    assert sorted(grouped) == ["/project/pkg/a.py", "/project/pkg/b.py"]
+    assert len(grouped["/project/pkg/a.py"]) == 2
+
+
+def test_apply_edits_single_pass() -> None:
+    # Вставки и замены применяются за один проход по исходным позициям
+    lines = ["a\n", "b\n", "c\n", "d\n"]
+    edits = [Edit(4, 4, ["end\n"]), Edit(1, 3, ["x\n"]), Edit(0, 0, ["start\n"])]
+    assert CodeChanger._apply_edits(lines, edits) == ["start\n", "a\n", "x\n", "d\n", "end\n"]
+
+
+def test_process_file_with_several_objects(tmp_path: Path) -> None:
+    # Несколько вставок и замена сгенерированной документации в одном файле
+    file_path = tmp_path / "test.py"
+    file_path.write_text(
+        'class A:\n'
+        '    def old(self):\n'
+        '        """\n'
+        '        Generated documentation\n'
+        '        """\n'
+        '        pass\n'
+        '\n'
+        'def f():\n'
+        '    pass\n',
+        encoding="utf-8",
+    )
+    ai_data = {
+        f"{file_path}/A": PosWithDoc(Position(0, 0, 6), "Class A."),
+        f"{file_path}/A/old": PosWithDoc(Position(1, 4, 6), "New doc."),
+        f"{file_path}/f": PosWithDoc(Position(7, 0, 9), "Function f."),
+    }
+    CodeChanger(regen=True).process_files(ai_data)
+
+    assert file_path.read_text(encoding="utf-8") == (
+        'class A:\n'
+        '    """\n'
+        '    Generated documentation\n'
+        '    \n'
+        '    Class A.\n'
+        '    """\n'
+        '    def old(self):\n'
+        '        """\n'
+        '        Generated documentation\n'
+        '        \n'
+        '        New doc.\n'
+        '        """\n'
+        '        pass\n'
+        '\n'
+        'def f():\n'
+        '    """\n'
+        '    Generated documentation\n'
+        '    \n'
+        '    Function f.\n'
+        '    """\n'
+        '    pass\n'
+    )
+
+
+def test_docstring_from_parsed_position() -> None:
+    # Если парсер нашел заголовок и docstring, строки не сканируются повторно
+    lines = ["def foo(\n", "    a,\n", "):\n", '    """Generated documentation"""\n', "    pass\n"]
+    position = Position(0, 0, 5, header_end=2, doc_start=3, doc_end=3, body_indent="    ")
+    assert CodeChanger.has_existing_docstring(lines, position)
+    assert CodeChanger.is_generated_docstring(lines, position)
+    assert not CodeChanger.has_existing_docstring(lines, Position(0, 0, 5, header_end=2))
+    assert CodeChanger()._replace_docstring(lines, position, "New.")[3:7] == [
+        '    """\n',
+        '    Generated documentation\n',
+        '    \n',
+        '    New.\n',
+    ]
+
+
+def test_definition_index_scans_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Индекс находит конец заголовка и docstring один раз для каждого определения
+    lines = ["def foo(\n", "    a,\n", "):\n", '    """\n', "    Generated documentation\n", '    """\n', "    pass\n"]
+    calls: list[int] = []
+    find_end = CodeChanger._find_end_of_definition
+
+    def counting_find_end(lines: list[str], start_line: int) -> int:
+        calls.append(start_line)
+        return find_end(lines, start_line)
+
+    monkeypatch.setattr(CodeChanger, "_find_end_of_definition", staticmethod(counting_find_end))
+    index = DefinitionIndex(lines)
+    position = Position(0, 0, 7)
+
+    assert index.get(position) == Definition(2, 3, 5, True, "    ")
+    assert CodeChanger.has_existing_docstring(lines, position, index)
+    assert CodeChanger.is_generated_docstring(lines, position, index)
+    assert CodeChanger.remove_docstring(lines, position, False, index) == [
+        "def foo(\n",
+        "    a,\n",
+        "):\n",
+        "    pass\n",
+    ]
+    assert calls == [0]
+
+
+def test_process_files_returns_result_of_every_file(tmp_path: Path) -> None:
+    # Файлы обрабатываются в пуле потоков, файл с той же документацией не перезаписывается
+    paths = [tmp_path / f"m{i}.py" for i in range(4)]
+    for path in paths:
+        path.write_text("def f():\n    pass\n", encoding="utf-8")
+    paths[3].write_text('def f():\n    """Doc."""\n', encoding="utf-8")
+
+    def parse(regen: bool) -> dict[str, PosWithDoc]:
+        result: dict[str, PosWithDoc] = {}
+        for path in paths:
+            parser = AstParser(str(path))
+            objects = parser.parse_generated_from_file(str(path)) if regen else parser.parse_from_file(str(path))
+            result.update({key: PosWithDoc(value.position, "Doc", value.source) for key, value in objects.items()})
+        return result
+
+    ai_data = parse(regen=False)
+    ai_data[f"{os.path.realpath(paths[3])}/f"] = PosWithDoc(Position(0, 0, 2), "Doc")
+    results = CodeChanger(jobs=4).process_files(ai_data)
+    assert [(Path(result.path).name, result.status) for result in results] == [
+        ("m0.py", CodeChanger.WRITTEN),
+        ("m1.py", CodeChanger.WRITTEN),
+        ("m2.py", CodeChanger.WRITTEN),
+        ("m3.py", CodeChanger.DOCUMENTED),
+    ]
+    assert CodeChanger.describe(results[3]).startswith("Файл")
+
+    mtime = os.stat(paths[0]).st_mtime_ns
+    results = CodeChanger(regen=True, jobs=4).process_files(parse(regen=True))
+    assert {result.status for result in results} == {CodeChanger.UNCHANGED}
+    assert os.stat(paths[0]).st_mtime_ns == mtime
+
+
+@pytest.mark.parametrize("parser_class", [Parser, AstParser])
+def test_docstring_indent_is_taken_from_body(tmp_path: Path, parser_class: type[Parser]) -> None:
+    # Отступ docstring берется из тела: перенесенные аргументы и однострочные функции не ломают файл
+    path = tmp_path / "m.py"
+    path.write_text(
+        "class A:\n"
+        "    def run(self,\n"
+        "            value):\n"
+        "        return value\n"
+        "\n"
+        "    def one(self): return 1\n"
+        "\n"
+        "def two(): return 2\n",
+        encoding="utf-8",
+    )
+    objects = parser_class(str(path)).parse_from_file(str(path))
+    ai_data = {key: PosWithDoc(value.position, "Doc", value.source) for key, value in objects.items()}
+    results = CodeChanger().process_files(ai_data)
+
+    assert [result.status for result in results] == [CodeChanger.WRITTEN]
+    code = path.read_text(encoding="utf-8")
+    ast.parse(code)
+    assert code.splitlines()[6:10] == [
+        "    def run(self,",
+        "            value):",
+        '        """',
+        "        Generated documentation",
+    ]
+    assert code.endswith("        return value\n\n    def one(self): return 1\n\ndef two(): return 2\n")
+
+
+@pytest.mark.parametrize("parser_class", [Parser, AstParser])
+def test_docstring_keeps_tab_indent_of_body(tmp_path: Path, parser_class: type[Parser]) -> None:
+    # Отступ docstring копируется из тела как есть, табуляции не заменяются пробелами
+    path = tmp_path / "m.py"
+    path.write_text("class A:\n\tdef run(self):\n\t\treturn 1\n", encoding="utf-8")
+    objects = parser_class(str(path)).parse_from_file(str(path))
+    results = CodeChanger().process_files({key: PosWithDoc(v.position, "Doc", v.source) for key, v in objects.items()})
+
+    assert [result.status for result in results] == [CodeChanger.WRITTEN]
+    code = path.read_text(encoding="utf-8")
+    ast.parse(code)
+    assert code.splitlines()[:3] == ["class A:", '\t"""', "\tGenerated documentation"]
+    assert not any(line.startswith(" ") for line in code.splitlines())
+
+
+def test_broken_code_is_not_written(tmp_path: Path) -> None:
+    # Если после вставки документации код не разбирается, файл не перезаписывается и возвращается ошибка
+    path = tmp_path / "m.py"
+    path.write_text("def f():\n    return 1\n", encoding="utf-8")
+    position = Position(0, 0, 2, header_end=0, body_indent="  ")
+    results = CodeChanger().process_files({f"{os.path.realpath(path)}/f": PosWithDoc(position, "Doc")})
+
+    assert [result.status for result in results] == [CodeChanger.FAILED]
+    assert "не разбирается" in results[0].error
+    assert path.read_text(encoding="utf-8") == "def f():\n    return 1\n"
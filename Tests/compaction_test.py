@@ -0,0 +1,51 @@
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.compaction import CAP_BODIES, ELIDE_LITERALS, NONE, STRIP, Compactor
+from fiit_docgen.records import Position, PosWithBody
+
+CODE = (
+    "    def f(self, x):  # comment\n"
+    "        # only comment\n"
+    "\n"
+    "        text = '# not a comment'\n"
+    "        long = 'a very long string literal, which does not help to understand what the method does'\n"
+    "        return x\n"
+)
+
+
+def test_compaction_levels() -> None:
+    # Каждый уровень сжатия включает предыдущие, число сэкономленных байтов считается
+    assert Compactor(NONE).compact(CODE) == CODE
+
+    compactor = Compactor(STRIP)
+    stripped = compactor.compact(CODE)
+    assert stripped == (
+        "def f(self, x):\n"
+        "    text = '# not a comment'\n"
+        "    long = 'a very long string literal, which does not help to understand what the method does'\n"
+        "    return x\n"
+    )
+    assert compactor.bytes_saved == len(CODE) - len(stripped)
+
+    elided = Compactor(ELIDE_LITERALS).compact(CODE)
+    assert "    long = '...'\n" in elided and "'# not a comment'" in elided
+
+
+def test_compaction_caps_only_long_bodies_without_nested_objects() -> None:
+    # Длинное тело сокращается до начала и конца, функции с вложенными объектами не сокращаются
+    body = "".join(f"    x{i} = {i}\n" for i in range(50))
+    compactor = Compactor(CAP_BODIES, max_body_lines=20, head_lines=5, tail_lines=3)
+
+    capped = compactor.compact(f"def f():\n{body}    return x49\n").splitlines()
+    assert capped[:7] == ["def f():", *[f"    x{i} = {i}" for i in range(5)], "    ...  # 43 lines elided"]
+    assert capped[-3:] == ["    x48 = 48", "    x49 = 49", "    return x49"]
+
+    nested = f"def g():\n{body}    def inner():\n        pass\n"
+    assert compactor.compact(nested) == nested
+    assert compactor.compact("def broken(:\n    pass\n") == "def broken(:\n    pass\n"
+
+
+def test_requester_sends_compacted_code() -> None:
+    # В запрос попадает сжатый код, кэш и поиск копий используют исходный
+    objects = {"a.py/A/f": PosWithBody(Position(1, 4, 7), CODE.splitlines(keepends=True))}
+    requester = AIRequester(objects, compactor=Compactor(ELIDE_LITERALS))
+    assert requester._batches[0].body["contents"][1]["parts"][0]["text"].startswith("def f(self, x):\n    text")
@@ -0,0 +1,75 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from benchmarks.corpus import write_corpus
+from benchmarks.mock_server import MockGemini
+from fiit_docgen.cache import DEFAULT_CACHE_DIR
+from fiit_docgen.console import DocGen
+
+
+def test_check_reports_undocumented_objects(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    # --check выводит недокументированные объекты нескольких файлов и завершается с кодом 1 без API-ключа
+    documented = tmp_path / "a.py"
+    documented.write_text('def f():\n    """Doc."""\n', encoding="utf-8")
+    undocumented = tmp_path / "b.py"
+    undocumented.write_text("class A:\n    def run(self):\n        pass\n", encoding="utf-8")
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    monkeypatch.setattr("sys.argv", ["docgen", "--check", str(documented), str(undocumented)])
+    with pytest.raises(SystemExit) as exit_info:
+        DocGen().run()
+    assert exit_info.value.code == 1
+    assert capsys.readouterr().out.splitlines()[:2] == [
+        "b.py:1: A is not documented",
+        "b.py:2: A/run is not documented",
+    ]
+
+    monkeypatch.setattr("sys.argv", ["docgen", "--check", str(documented)])
+    DocGen().run()
+    assert "All 1 items are documented" in capsys.readouterr().out
+
+
+def test_console_does_not_import_network_modules() -> None:
+    # Модули для работы с сетью импортируются только при обращении к AI, --check запускается быстро
+    code = "import sys, fiit_docgen.console; print(sorted({'requests', 'asyncio', 'sqlite3'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_no_cache_run_is_not_journaled(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # С --no-cache в рабочей директории не создается .docgen, а --resume с ним отклоняется
+    files = write_corpus(tmp_path / "project", files=1, functions=5)
+    monkeypatch.chdir(tmp_path)
+    with MockGemini() as mock:
+        argv = ["docgen", str(files[0]), "--url", mock.url, "--api-key", "key", "--no-cache"]
+        monkeypatch.setattr("sys.argv", argv)
+        DocGen().run()
+        assert mock.requests == 1
+
+    assert "Generated documentation" in files[0].read_text(encoding="utf-8")
+    assert not (tmp_path / DEFAULT_CACHE_DIR).exists()
+
+    monkeypatch.setattr("sys.argv", [*argv, "--resume"])
+    with pytest.raises(SystemExit) as exit_info:
+        DocGen().run()
+    assert exit_info.value.code == 2
+
+
+def test_regen_requests_ai_despite_cached_documentation(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # --regen обращается к AI, даже если документация этого кода уже есть в кэше
+    files = write_corpus(tmp_path / "project", files=1, functions=5)
+    monkeypatch.chdir(tmp_path)
+    with MockGemini() as mock:
+        argv = ["docgen", str(files[0]), "--url", mock.url, "--api-key", "key"]
+        monkeypatch.setattr("sys.argv", argv)
+        DocGen().run()
+        assert mock.requests == 1
+
+        monkeypatch.setattr("sys.argv", [*argv, "--regen"])
+        DocGen().run()
+        assert mock.requests == 2
@@ -0,0 +1,73 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from fiit_docgen.git_diff import _parse_diff, changed_lines, filter_changed
+from fiit_docgen.parser import AstParser
+
+
+def _git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_parse_diff_ranges() -> None:
+    # Разбор заголовков ханков: добавление, изменение и удаление строк
+    diff = (
+        "diff --git a/a.py b/a.py\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1,0 +2,3 @@\n"
+        "@@ -10 +12 @@\n"
+        "@@ -20,2 +21,0 @@\n"
+        "diff --git a/b.py b/b.py\n"
+        "--- a/b.py\n"
+        "+++ /dev/null\n"
+        "@@ -1,2 +0,0 @@\n"
+    )
+    changes = _parse_diff(diff, "/repo")
+    assert changes == {os.path.realpath("/repo/a.py"): [(1, 4), (11, 12), (20, 21)]}
+
+
+@pytest.mark.parametrize("config", [[], ["diff.noprefix", "true"], ["diff.mnemonicPrefix", "true"]])
+def test_changed_objects_since_ref(tmp_path: Path, config: list[str]) -> None:
+    # Только объекты, строки которых изменились после коммита, и объекты новых файлов (при любых префиксах diff)
+    _git(tmp_path, "init", "-q")
+    if config:
+        _git(tmp_path, "config", *config)
+    file_path = tmp_path / "a.py"
+    file_path.write_text("def first():\n    return 1\n\n\ndef second():\n    return 2\n", encoding="utf-8")
+    _git(tmp_path, "add", "a.py")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+
+    file_path.write_text("def first():\n    return 1\n\n\ndef second():\n    return 3\n", encoding="utf-8")
+    new_path = tmp_path / "b.py"
+    new_path.write_text("def third():\n    pass\n", encoding="utf-8")
+
+    changes = changed_lines("HEAD", tmp_path)
+    objects = AstParser(str(file_path)).parse_from_file(str(file_path))
+    objects.update(AstParser(str(new_path)).parse_from_file(str(new_path)))
+
+    root = os.path.realpath(tmp_path)
+    assert list(filter_changed(objects, changes)) == [f"{root}/a.py/second", f"{root}/b.py/third"]
+
+
+def test_changed_files_with_special_names(tmp_path: Path) -> None:
+    # Имена с пробелом (git добавляет табуляцию) и с кавычками (git экранирует имя) находятся так же, как обычные
+    _git(tmp_path, "init", "-q")
+    names = ["my file.py", 'na"me.py', "plain.py"]
+    for name in names:
+        (tmp_path / name).write_text("def f():\n    return 1\n", encoding="utf-8")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+    for name in names:
+        (tmp_path / name).write_text("def f():\n    return 2\n", encoding="utf-8")
+    (tmp_path / 'new "q".py').write_text("def g():\n    pass\n", encoding="utf-8")
+
+    root = os.path.realpath(tmp_path)
+    assert sorted(changed_lines("HEAD", tmp_path)) == sorted(f"{root}/{name}" for name in [*names, 'new "q".py'])
@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+from benchmarks.corpus import write_corpus
+from benchmarks.mock_server import MockGemini
+from fiit_docgen.console import DocGen
+from fiit_docgen.journal import Journal, ProgressiveWriter
+from fiit_docgen.project import parse_files
+from fiit_docgen.records import FileResult, Position, PosWithBody, PosWithDoc
+
+
+def _objects() -> dict[str, PosWithBody]:
+    return {
+        "a.py/f": PosWithBody(Position(0, 0, 2), ["def f(x):\n", "    return x\n"]),
+        "a.py/g": PosWithBody(Position(3, 0, 5), ["def g():\n", "    pass\n"]),
+        "b.py/h": PosWithBody(Position(0, 0, 2), ["def h():\n", "    pass\n"]),
+    }
+
+
+def test_journal_resumes_only_unchanged_objects(tmp_path: Path) -> None:
+    # Документация из журнала возвращается только для объектов с тем же кодом, оборванная строка пропускается
+    objects = _objects()
+    journal = Journal(tmp_path)
+    journal.append({key: PosWithDoc(value.position, f"Doc of {key}") for key, value in objects.items()}, objects)
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"key": "a.py/g", "fingerp')
+
+    objects["a.py/g"] = PosWithBody(Position(4, 0, 6), ["def g():\n", "    return 1\n"])
+    objects["b.py/h"] = PosWithBody(Position(1, 0, 3), objects["b.py/h"].body)
+    resumed = Journal(tmp_path).resume(objects)
+    assert {key: doc.Documentation for key, doc in resumed.items()} == {
+        "a.py/f": "Doc of a.py/f",
+        "b.py/h": "Doc of b.py/h",
+    }
+    assert resumed["b.py/h"].Position == Position(1, 0, 3)
+
+    journal.clear()
+    assert not journal.path.exists()
+    assert Journal(tmp_path).resume(objects) == {}
+
+
+def test_progressive_writer_writes_file_when_all_objects_are_documented() -> None:
+    # Файл записывается, как только документированы все его объекты, остальные файлы - в конце
+    written: list[list[str]] = []
+
+    def write(docs: dict[str, PosWithDoc]) -> list[FileResult]:
+        written.append(sorted(docs))
+        return [FileResult(min(docs), "written")]
+
+    writer = ProgressiveWriter(_objects(), write)
+    writer.add({"a.py/f": PosWithDoc(Position(0, 0), "Doc"), "b.py/h": PosWithDoc(Position(0, 0), "Doc")})
+    assert written == [["b.py/h"]]
+    writer.add({"a.py/f": PosWithDoc(Position(0, 0), "Doc again")})
+    writer.finish()
+    assert written == [["b.py/h"], ["a.py/f"]]
+    assert writer.files_written == 2
+
+
+def test_resume_requests_only_objects_missing_in_journal(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # При --resume объекты из журнала прерванного запуска не запрашиваются повторно, но записываются в файлы
+    project, cache = tmp_path / "project", tmp_path / "cache"
+    files = write_corpus(project, files=2, functions=10)
+    objects = parse_files(files, jobs=1).objects
+    journaled = {key: value for key, value in objects.items() if "package_0" in key}
+    journal = Journal(cache)
+    journal.append({key: PosWithDoc(value.position, "Journaled doc") for key, value in journaled.items()}, objects)
+    journal.close()
+
+    with MockGemini() as mock:
+        argv = ["docgen", str(project), "--url", mock.url, "--api-key", "key", "--cache-dir", str(cache), "--resume"]
+        monkeypatch.setattr("sys.argv", argv)
+        DocGen().run()
+        assert mock.requests == 1
+
+    assert "Journaled doc" in files[0].read_text(encoding="utf-8")
+    assert "Generated documentation" in files[1].read_text(encoding="utf-8")
+    assert not (cache / Journal.FILE_NAME).exists()
@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.records import Position, PosWithBody
+from fiit_docgen.scheduler import RateLimiter
+from fiit_docgen.transport import Transport, TransportResponse
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        self.now += 0.5
+        return self.now
+
+
+def test_metrics_summary_and_textfile(tmp_path: Path) -> None:
+    # Время этапов суммируется, сводка сохраняется в JSON и в формате Prometheus
+    metrics = Metrics(clock=FakeClock())
+    with metrics.stage("parse"):
+        metrics.add("objects_parsed", 3)
+    with metrics.stage("parse"):
+        pass
+    metrics.observe("http_request", 2.0)
+    metrics.observe("http_request", 1.0)
+
+    metrics.write_json(tmp_path / "profile.json")
+    assert json.loads((tmp_path / "profile.json").read_text(encoding="utf-8")) == {
+        "stages": {"parse": 1.0},
+        "counters": {"objects_parsed": 3},
+        "timings": {"http_request": {"count": 2, "sum": 3.0, "max": 2.0}},
+    }
+
+    metrics.write_prometheus(tmp_path / "docgen.prom")
+    text = (tmp_path / "docgen.prom").read_text(encoding="utf-8")
+    assert 'docgen_stage_seconds{stage="parse"} 1.0\n' in text
+    assert "docgen_objects_parsed 3\n" in text
+    assert "docgen_http_request_seconds_count 2\n" in text
+
+
+def test_nested_stage_is_not_counted_twice() -> None:
+    # Время вложенного этапа не входит во время внешнего этапа
+    metrics = Metrics(clock=FakeClock())
+    with metrics.stage("generate"):
+        with metrics.stage("apply"):
+            pass
+    assert metrics.to_dict()["stages"] == {"generate": 1.0, "apply": 0.5}
+
+
+class RateLimitedTransport(Transport):
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def post(self, url: str, body: object, headers: dict[str, str] | None = None) -> TransportResponse:
+        self.requests += 1
+        if self.requests == 1:
+            return TransportResponse(429, {"error": {"details": [{"retryDelay": "0s"}]}})
+        return TransportResponse(200, {"candidates": [{"content": {"parts": [{"text": "f: Identity"}]}}]})
+
+
+def test_requester_records_http_metrics() -> None:
+    # Запросы, ответы 429 и объем отправленных данных попадают в метрики
+    metrics = Metrics()
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=lambda seconds: None)
+    objects = {"a.py/f": PosWithBody(Position(0, 0, 2), ["def f(x):\n", "    return x\n"])}
+    AIRequester(objects, transport=RateLimitedTransport(), rate_limiter=limiter, metrics=metrics).get_docs()
+
+    summary = metrics.to_dict()
+    assert summary["counters"]["http_requests"] == 2
+    assert summary["counters"]["http_status_429"] == 1
+    assert summary["counters"]["rate_limited"] == 1
+    assert summary["counters"]["bytes_sent"] > summary["counters"]["tokens_sent"] > 0
+    assert summary["timings"]["http_request"]["count"] == 2
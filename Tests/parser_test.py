@@ -1,7 +1,7 @@
 import os
 import tempfile
 
-from fiit_docgen.parser import Parser
+from fiit_docgen.parser import AstParser, Parser
 from fiit_docgen.records import Position, PosWithBody
 
 
@@ -208,3 +208,125 @@ def test_pos_with_body_default_factory() -> None:
     item2 = PosWithBody(Position(1, 0))
     item1.body.append("x")
     assert item2.body == []
+
+
+def test_ast_parser_exact_spans() -> None:
+    # Парсер на основе ast: декораторы, многострочный заголовок, docstring и конец тела
+    code = '''@decorator(
+    1)
+def outer(a,
+          b: dict[str, int] = {"x": 1}) -> int:
+    """Doc."""
+    def inner():
+        return 42
+    return inner()
+'''
+    with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+        f.write(code)
+        f.flush()
+        parser = AstParser(f.name)
+        result = parser.parse_from_file(f.name)
+
+    path = os.path.realpath(f.name)
+    outer = parser._dictionary[f"{path}/outer"].position
+    assert (outer.start_line, outer.end_line, outer.decorators) == (2, 8, 2)
+    assert (outer.header_end, outer.doc_start, outer.doc_end) == (3, 4, 4)
+    assert f"{path}/outer" not in result
+
+    inner = result[f"{path}/outer/inner"]
+    assert (inner.position.start_line, inner.position.end_line, inner.position.doc_start) == (5, 7, -1)
+    assert inner.body == ["    def inner():\n", "        return 42\n"]
+
+
+def test_ast_parser_nested_in_blocks() -> None:
+    # Функция внутри if на верхнем уровне не считается методом предыдущего класса
+    code = """class A:
+    x = 1
+
+if True:
+    def cond():
+        pass
+"""
+    with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+        f.write(code)
+        f.flush()
+        result = AstParser(f.name).parse_from_file(f.name)
+
+    path = os.path.realpath(f.name)
+    assert list(result) == [f"{path}/A", f"{path}/cond"]
+
+
+def test_ast_parser_falls_back_on_syntax_error() -> None:
+    # Файл с синтаксической ошибкой разбирается базовым парсером
+    code = """def broken(:
+    pass
+"""
+    with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+        f.write(code)
+        f.flush()
+        result = AstParser(f.name).parse_from_file(f.name)
+
+    path = os.path.realpath(f.name)
+    assert f"{path}/broken" in result
+    assert result[f"{path}/broken"].position.header_end == -1
+
+
+def test_bodies_share_lines_of_file() -> None:
+    # Тела объектов хранятся как диапазоны строк файла без копирования, docstring в тело не входит
+    code = '''class A:
+    """Doc."""
+
+    def run(self):
+        return 1
+'''
+    with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+        f.write(code)
+        f.flush()
+        for parser in (Parser(f.name), AstParser(f.name)):
+            parser.parse_from_file(f.name)
+            path = os.path.realpath(f.name)
+            outer, method = parser._dictionary[f"{path}/A"], parser._dictionary[f"{path}/A/run"]
+            assert outer.lines is method.lines is parser._file
+            assert outer.spans == ((0, 1), (2, 5))
+            assert outer.text == "class A:\n\n    def run(self):\n        return 1\n"
+            assert method.body == ["    def run(self):\n", "        return 1\n"]
+
+
+def test_ast_parser_header_end_and_body_indent() -> None:
+    # Конец заголовка находится по первой инструкции тела без токенизации, комментарии после заголовка пропускаются
+    code = '''def f(a,  # first
+      b: str = ":"):  # header
+    # comment
+
+  return a
+def g(): return 1
+'''
+    with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+        f.write(code)
+        f.flush()
+        parser = AstParser(f.name)
+        parser.parse_from_file(f.name)
+
+    path = os.path.realpath(f.name)
+    f_position = parser._dictionary[f"{path}/f"].position
+    g_position = parser._dictionary[f"{path}/g"].position
+    assert (f_position.header_end, f_position.body_indent) == (1, "  ")
+    assert (g_position.header_end, g_position.body_indent) == (5, "")
+
+
+def test_decorated_method_body_excludes_docstring() -> None:
+    # В тело декорированного метода входят декораторы, но не его docstring, в обоих парсерах
+    code = '''class A:
+    @property
+    def run(self):
+        """Doc."""
+        return 1
+'''
+    with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+        f.write(code)
+        f.flush()
+        for parser in (Parser(f.name), AstParser(f.name)):
+            parser.parse_from_file(f.name)
+            method = parser._dictionary[f"{os.path.realpath(f.name)}/A/run"]
+            assert method.body == ["    @property\n", "    def run(self):\n", "        return 1\n"]
+            assert (method.position.start_line, method.position.decorators) == (2, 1)
@@ -0,0 +1,40 @@
+import os
+from pathlib import Path
+
+from fiit_docgen.project import DEFAULT_EXCLUDE, find_python_files, parse_files
+
+
+def _make_project(root: Path) -> None:
+    (root / "pkg").mkdir()
+    (root / "pkg" / "__pycache__").mkdir()
+    (root / "pkg" / "a.py").write_text("def foo():\n    pass\n", encoding="utf-8")
+    (root / "pkg" / "b.py").write_text('class B:\n    """Doc."""\n    def bar(self):\n        pass\n', encoding="utf-8")
+    (root / "pkg" / "__pycache__" / "c.py").write_text("def skipped():\n    pass\n", encoding="utf-8")
+    (root / "notes.txt").write_text("def not_python():\n    pass\n", encoding="utf-8")
+
+
+def test_find_python_files_default(tmp_path: Path) -> None:
+    # Находит только .py файлы и пропускает служебные директории
+    _make_project(tmp_path)
+    files = find_python_files(tmp_path)
+    assert files == [tmp_path / "pkg" / "a.py", tmp_path / "pkg" / "b.py"]
+
+
+def test_find_python_files_include_exclude(tmp_path: Path) -> None:
+    # Пользовательские include/exclude шаблоны
+    _make_project(tmp_path)
+    assert find_python_files(tmp_path, exclude=[*DEFAULT_EXCLUDE, "pkg/a.py"]) == [tmp_path / "pkg" / "b.py"]
+    assert find_python_files(tmp_path, include=["*.txt"]) == [tmp_path / "notes.txt"]
+    assert find_python_files(tmp_path, exclude=["pkg"]) == []
+
+
+def test_parse_files_merges_results(tmp_path: Path) -> None:
+    # Результаты парсинга нескольких файлов объединяются в один словарь
+    _make_project(tmp_path)
+    files = find_python_files(tmp_path)
+    objects, objects_length = parse_files(files, jobs=2)
+
+    root = os.path.realpath(tmp_path)
+    assert objects_length == 3
+    assert list(objects.keys()) == [f"{root}/pkg/a.py/foo", f"{root}/pkg/b.py/B/bar"]
+    assert objects[f"{root}/pkg/b.py/B/bar"].position.start_line == 2
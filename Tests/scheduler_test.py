@@ -0,0 +1,76 @@
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.records import Position, PosWithBody, RequestBody
+from fiit_docgen.scheduler import RateLimiter, RateLimitExceeded, backoff_delay, parse_retry_delay
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimitedRequester(AIRequester):
+    def __init__(self, objects_to_doc: dict[str, PosWithBody], rate_limiter: RateLimiter, failures: int) -> None:
+        super().__init__(objects_to_doc, rate_limiter=rate_limiter)
+        self.failures = failures
+        self.calls = 0
+
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RateLimitExceeded(5.0)
+        return "f: Function"
+
+
+def test_parse_retry_delay() -> None:
+    # Разбор retryDelay в формате Google API
+    assert parse_retry_delay("17s") == 17.0
+    assert parse_retry_delay("1.5s") == 1.5
+    assert parse_retry_delay("300ms") == 0.3
+    assert parse_retry_delay("soon") is None
+    assert parse_retry_delay(None) is None
+
+
+def test_backoff_delay_with_jitter() -> None:
+    # Задержка сервера соблюдается, без нее - экспоненциальная
+    assert 10.0 <= backoff_delay(1, 10.0) <= 11.0
+    assert 2.0 <= backoff_delay(1) <= 3.0
+    assert 8.0 <= backoff_delay(3) <= 9.0
+
+
+def test_rate_limiter_requests_per_minute() -> None:
+    # После исчерпания запаса запросы ждут пополнения корзины
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=60, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        assert limiter.acquire() == 0
+    assert limiter.acquire() == 1.0
+
+
+def test_rate_limiter_tokens_and_pause() -> None:
+    # Лимит токенов и пауза после 429
+    clock = FakeClock()
+    limiter = RateLimiter(tokens_per_minute=600, clock=clock, sleep=clock.sleep)
+    limiter.acquire(100)
+    assert limiter.acquire(60) == 6.0
+    limiter.pause(30)
+    assert limiter.acquire() == 30.0
+
+
+def test_requester_retries_after_429() -> None:
+    # При 429 запрос повторяется после задержки, а не завершает программу
+    clock = FakeClock()
+    objects = {"a.py/f": PosWithBody(Position(0, 0, 2), ["def f():\n", "    pass\n"])}
+    requester = RateLimitedRequester(objects, RateLimiter(clock=clock, sleep=clock.sleep), failures=2)
+    docs = requester.get_docs()
+    assert docs["a.py/f"].Documentation == "Function"
+    assert requester.calls == 3
+    assert len(clock.sleeps) == 2
+    assert all(5.0 <= sleep <= 6.0 for sleep in clock.sleeps)
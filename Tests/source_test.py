@@ -0,0 +1,85 @@
+import codecs
+import os
+from pathlib import Path
+
+import pytest
+from fiit_docgen.code_changer import CodeChanger
+from fiit_docgen.parser import AstParser, Parser
+from fiit_docgen.records import PosWithDoc
+from fiit_docgen.source import SourceFile, SourceFileChanged, atomic_write
+
+
+def test_source_file_keeps_bom_and_newlines(tmp_path: Path) -> None:
+    # BOM и переводы строк \r\n сохраняются при записи
+    file_path = tmp_path / "test.py"
+    file_path.write_bytes(codecs.BOM_UTF8 + b"def foo():\r\n    pass\r\n")
+    source = SourceFile.read(str(file_path))
+    assert source.lines == ["def foo():\n", "    pass\n"]
+
+    source.write(["def foo():\n", "    return 1\n"])
+    assert file_path.read_bytes() == codecs.BOM_UTF8 + b"def foo():\r\n    return 1\r\n"
+    assert not source.is_changed()
+    assert [name for name in os.listdir(tmp_path)] == ["test.py"]
+
+
+@pytest.mark.parametrize("parser_class", [Parser, AstParser])
+def test_mixed_line_endings_are_kept(tmp_path: Path, parser_class: type[Parser]) -> None:
+    # В файле со смешанными переводами строк каждая строка сохраняет свой перевод, меняется только документация
+    file_path = tmp_path / "test.py"
+    file_path.write_bytes(b"def foo():\r\n    pass\r\n\r\nclass A:\n    def run(self):\n\n        return 1\n")
+    parsed = parser_class(str(file_path)).parse_from_file(str(file_path))
+    assert list(parsed) == [f"{os.path.realpath(file_path)}/{name}" for name in ("foo", "A", "A/run")]
+    CodeChanger().process_files(
+        {key: PosWithDoc(value.position, "Doc.", value.source) for key, value in parsed.items()}
+    )
+
+    data = file_path.read_bytes()
+    assert data.startswith(b'def foo():\r\n    """\n')
+    assert b'    """\n    pass\r\n\r\nclass A:\n' in data
+    assert data.endswith(b'        """\n\n        return 1\n')
+    assert data.count(b"\r\n") == 3
+
+
+def test_source_file_refuses_write_after_change(tmp_path: Path) -> None:
+    # Запись отклоняется, если файл изменился после чтения
+    file_path = tmp_path / "test.py"
+    file_path.write_text("def foo():\n    pass\n", encoding="utf-8")
+    source = SourceFile.read(str(file_path))
+
+    file_path.write_text("def bar():\n    pass\n", encoding="utf-8")
+    os.utime(file_path, ns=(source.mtime_ns + 10**9, source.mtime_ns + 10**9))
+    assert source.is_changed()
+    with pytest.raises(SourceFileChanged):
+        source.write(["x = 1\n"])
+    assert file_path.read_text(encoding="utf-8") == "def bar():\n    pass\n"
+
+
+def test_code_changer_uses_parsed_source(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # CodeChanger работает с файлом, прочитанным парсером, и не читает его повторно
+    file_path = tmp_path / "test.py"
+    file_path.write_text("def foo():\n    pass\n", encoding="utf-8")
+    parsed = AstParser(str(file_path)).parse_from_file(str(file_path))
+    ai_data = {key: PosWithDoc(value.position, "Doc.", value.source) for key, value in parsed.items()}
+
+    def fail_read(path: str) -> SourceFile:
+        raise AssertionError("file is read twice")
+
+    monkeypatch.setattr(SourceFile, "read", staticmethod(fail_read))
+    CodeChanger().process_files(ai_data)
+    assert "    Doc.\n" in file_path.read_text(encoding="utf-8")
+
+
+def test_atomic_write_keeps_file_on_failure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Файл заменяется целиком, при ошибке остается прежним и временный файл удаляется
+    file_path = tmp_path / "cache" / "data.json"
+    atomic_write(file_path, b"old")
+    assert file_path.read_bytes() == b"old"
+
+    def fail(src: str, dst: str) -> None:
+        raise OSError("disk is full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write(file_path, b"new")
+    assert file_path.read_bytes() == b"old"
+    assert os.listdir(file_path.parent) == ["data.json"]
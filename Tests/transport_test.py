@@ -0,0 +1,68 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.records import Position, PosWithBody
+from fiit_docgen.scheduler import RateLimiter
+from fiit_docgen.transport import (
+    CassetteMiss,
+    RecordingTransport,
+    ReplayTransport,
+    Transport,
+    TransportResponse,
+)
+
+URL = "http://ai.local/v1/models/"
+
+
+class FakeTransport(Transport):
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        self.requests += 1
+        text = "f: Identity\nf/param x: value"
+        return TransportResponse(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+def _objects() -> dict[str, PosWithBody]:
+    return {"a.py/f": PosWithBody(Position(0, 0, 2), ["def f(x):\n", "    return x\n"])}
+
+
+def test_replay_recorded_answers_without_network(tmp_path: Path) -> None:
+    # Записанные ответы воспроизводятся без сети, ключ запроса не зависит от API-ключа
+    cassette = tmp_path / "cassette.json"
+    fake = FakeTransport()
+    recorded = AIRequester(
+        _objects(), url=URL, apikey="secret", transport=RecordingTransport(fake, cassette)
+    ).get_docs()
+    assert fake.requests == 1
+    assert "secret" not in cassette.read_text(encoding="utf-8")
+
+    replay = ReplayTransport(cassette)
+    assert AIRequester(_objects(), url=URL, apikey="other", transport=replay).get_docs() == recorded
+    assert replay.requests == 1
+
+    objects = {"a.py/g": PosWithBody(Position(0, 0, 2), ["def g():\n", "    pass\n"])}
+    with pytest.raises(CassetteMiss):
+        AIRequester(objects, url=URL, transport=replay).get_docs()
+
+
+def test_replay_injects_rate_limits(tmp_path: Path) -> None:
+    # Внедренные ответы 429 обрабатываются планировщиком: запрос повторяется после retryDelay
+    cassette = tmp_path / "cassette.json"
+    AIRequester(_objects(), url=URL, transport=RecordingTransport(FakeTransport(), cassette)).get_docs()
+
+    now = [0.0]
+
+    def sleep(seconds: float) -> None:
+        now[0] += seconds
+
+    replay = ReplayTransport(cassette, latency=0.5, rate_limit_rate=0.5, retry_delay=5.0, seed=3, sleep=sleep)
+    limiter = RateLimiter(clock=lambda: now[0], sleep=sleep)
+    docs = AIRequester(_objects(), url=URL, transport=replay, rate_limiter=limiter).get_docs()
+
+    assert docs["a.py/f"].Documentation == "Identity\n:param x: value"
+    assert replay.requests > 1
+    assert now[0] >= 5.0 * (replay.requests - 1)
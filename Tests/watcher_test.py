@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+from typing import Iterator
+
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.backends import Backend
+from fiit_docgen.records import PosWithBody, RequestBody
+from fiit_docgen.watcher import Watcher
+
+
+def _touch(path: Path, content: str) -> None:
+    # mtime меняется явно, чтобы изменение было видно даже при грубом разрешении времени файловой системы
+    stat = os.stat(path)
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_watcher_queues_only_new_or_changed_objects(tmp_path: Path) -> None:
+    # После первого парсинга в очередь попадают только новые или измененные недокументированные объекты
+    (tmp_path / "a.py").write_text("def first():\n    return 1\n\ndef second():\n    return 2\n", encoding="utf-8")
+    (tmp_path / "b.py").write_text("def third():\n    return 3\n", encoding="utf-8")
+    watcher = Watcher(tmp_path, sleep=lambda seconds: None)
+    root = os.path.realpath(tmp_path)
+
+    assert len(watcher.start()) == 3
+    assert watcher.poll() == {}
+
+    _touch(
+        tmp_path / "a.py",
+        'def first():\n    """Doc."""\n    return 1\n\ndef second():\n    return 20\n\ndef fourth():\n    pass\n',
+    )
+    assert list(watcher.poll()) == [f"{root}/a.py/second", f"{root}/a.py/fourth"]
+
+    (tmp_path / "b.py").unlink()
+    assert watcher.poll() == {}
+
+
+class SilentBackend(Backend):
+    def generate(self, body: RequestBody) -> str | None:
+        return ""
+
+    def stream(self, body: RequestBody) -> Iterator[str] | None:
+        return iter([])
+
+
+def test_watcher_survives_failed_documentation(tmp_path: Path) -> None:
+    # Если AI не вернул документацию, ошибка выводится и слежение продолжается, а не завершается sys.exit
+    file_path = tmp_path / "a.py"
+    file_path.write_text("def first():\n    return 1\n", encoding="utf-8")
+    calls: list[list[str]] = []
+
+    def callback(objects: dict[str, PosWithBody]) -> None:
+        calls.append(list(objects))
+        AIRequester(objects, backend=SilentBackend()).get_docs()
+
+    def sleep(seconds: float) -> None:
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        if not file_path.read_text(encoding="utf-8").endswith("return 2\n"):
+            _touch(file_path, "def first():\n    return 2\n")
+
+    Watcher(tmp_path, sleep=sleep).run(callback)
+    root = os.path.realpath(tmp_path)
+    assert calls == [[f"{root}/a.py/first"], [f"{root}/a.py/first"]]
@@ -0,0 +1,97 @@
+import random
+from pathlib import Path
+
+
+def _function(name: str, indent: str, decorators: int, multiline: bool) -> list[str]:
+    """
+    Code of one undocumented function
+    :param name: name of function
+    :param indent: indentation of definition
+    :param decorators: count of decorators above definition
+    :param multiline: split signature into several lines
+    :return: lines of code
+    """
+    lines = [f"{indent}@decorator_{i}\n" for i in range(decorators)]
+    if multiline:
+        lines += [
+            f"{indent}def {name}(\n",
+            f"{indent}    first: int,\n",
+            f"{indent}    second: str = 'value',\n",
+            f"{indent}    *args: object,\n",
+            f"{indent}    **kwargs: object,\n",
+            f"{indent}) -> dict[str, int]:\n",
+        ]
+    else:
+        lines.append(f"{indent}def {name}(first, second=None):\n")
+    lines += [
+        f"{indent}    result = {{'first': first}}\n",
+        f"{indent}    for i in range(10):\n",
+        f"{indent}        result[str(i)] = i * 2\n",
+        f"{indent}    return result\n",
+        "\n",
+    ]
+    return lines
+
+
+def _nested_class(name: str, depth: int, methods: int, decorators: int, indent: str = "") -> list[str]:
+    """
+    Code of class with nested classes
+    :param name: name of outer class
+    :param depth: count of nested levels, including outer class
+    :param methods: count of methods on each level
+    :param decorators: count of decorators above methods
+    :param indent: indentation of definition
+    :return: lines of code
+    """
+    lines = [f"{indent}class {name}:\n"]
+    for i in range(methods):
+        lines += _function(f"method_{i}", indent + "    ", decorators, multiline=i % 2 == 1)
+    if depth > 1:
+        lines += _nested_class(f"{name}Inner", depth - 1, methods, decorators, indent + "    ")
+    return lines
+
+
+def generate_module(functions: int, depth: int = 6, decorators: int = 8, seed: int = 0) -> str:
+    """
+    Generate module of undocumented code: plain functions, long decorator stacks,
+    multi-line signatures and deeply nested classes
+    :param functions: approximate count of functions and methods in module
+    :param depth: nesting level of classes
+    :param decorators: maximal count of decorators above function
+    :param seed: seed of random generator to get the same module every time
+    :return: code of module
+    """
+    rng = random.Random(seed)
+    lines = [f"def decorator_{i}(func):\n    return func\n\n\n" for i in range(decorators)]
+    count = 0
+    index = 0
+    while count < functions:
+        if index % 10 == 9:
+            lines += _nested_class(f"Class{index}", depth, 2, rng.randint(0, decorators))
+            count += depth * 2
+        else:
+            lines += _function(f"function_{index}", "", rng.randint(0, decorators), multiline=index % 3 == 0)
+            count += 1
+        lines.append("\n")
+        index += 1
+    return "".join(lines)
+
+
+def write_corpus(root: Path, files: int, functions: int, depth: int = 6, decorators: int = 8) -> list[Path]:
+    """
+    Write project of generated modules
+    :param root: directory of project
+    :param files: count of modules
+    :param functions: total count of functions in project
+    :param depth: nesting level of classes
+    :param decorators: maximal count of decorators above function
+    :return: paths of written modules
+    """
+    paths: list[Path] = []
+    for i in range(files):
+        package = root / f"package_{i % 4}"
+        package.mkdir(parents=True, exist_ok=True)
+        path = package / f"module_{i}.py"
+        path.write_text(generate_module(functions // files, depth, decorators, seed=i), encoding="utf-8")
+        paths.append(path)
+    return paths
@@ -0,0 +1,168 @@
+import ast
+import json
+import textwrap
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any, Callable
+
+
+def _describe(node: ast.AST, prefix: str) -> list[dict[str, Any]]:
+    """
+    Documentation of class or function and all objects inside it in format of JSON mode of AIRequester
+    :param node: node of class or function
+    :param prefix: path of outer objects
+    :return: elements of answer
+    """
+    if not isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+        return []
+    name = f"{prefix}{node.name}"
+    item: dict[str, Any] = {"path": name, "description": f"Generated documentation of {node.name}"}
+    if not isinstance(node, ast.ClassDef):
+        arguments = [*node.args.posonlyargs, *node.args.args, *node.args.kwonlyargs]
+        item["params"] = [{"name": argument.arg, "description": f"Argument {argument.arg}"} for argument in arguments]
+        item["return"] = f"Result of {node.name}"
+    items = [item]
+    for child in node.body:
+        items += _describe(child, f"{name}/")
+    return items
+
+
+def _lines(item: dict[str, Any]) -> list[str]:
+    """Lines of answer for one object in format of SYS_INSTRUCTION"""
+    name = item["path"]
+    lines = [f"{name}: {item['description']}"]
+    lines += [f"{name}/param {param['name']}: {param['description']}" for param in item.get("params", [])]
+    if "return" in item:
+        lines.append(f"{name}/return: {item['return']}")
+    return lines
+
+
+def answer(body: dict[str, Any]) -> str:
+    """
+    Build answer of AI for request body: documents every class and function sent in it
+    :param body: json body of generateContent request, JSON is answered if it asks for application/json
+    :return: text of answer
+    """
+    items: list[dict[str, Any]] = []
+    for part in body["contents"][-1]["parts"]:
+        try:
+            tree = ast.parse(textwrap.dedent(part["text"]))
+        except SyntaxError:
+            continue
+        for node in tree.body:
+            items += _describe(node, "")
+    if body.get("generationConfig", {}).get("responseMimeType") == "application/json":
+        return json.dumps(items, indent=1)
+    return "\n".join(line for item in items for line in _lines(item))
+
+
+def _candidate(text: str) -> dict[str, Any]:
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def _chat_answer(body: dict[str, Any]) -> str:
+    """Answer of AI for body of chat completion, code is in parts of user messages"""
+    messages = [message for message in body["messages"] if isinstance(message["content"], list)]
+    json_output = "response_format" in body
+    config = {"responseMimeType": "application/json" if json_output else "text/plain"}
+    return answer({"contents": [{"parts": message["content"]} for message in messages], "generationConfig": config})
+
+
+def _completion(text: str) -> dict[str, Any]:
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+
+
+def _delta(text: str) -> dict[str, Any]:
+    return {"choices": [{"index": 0, "delta": {"content": text}}]}
+
+
+def _events(
+    text: str, chunk_size: int = 200, event: Callable[[str], dict[str, Any]] = _candidate, end: str = ""
+) -> bytes:
+    """
+    Split answer into server-sent events, chunks do not respect line boundaries
+    :param text: text of answer
+    :param chunk_size: count of characters in one event
+    :param event: builds event from chunk (streamGenerateContent by default)
+    :param end: data of the last event (OpenAI-compatible APIs send [DONE])
+    :return: body of answer
+    """
+    chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+    data = [json.dumps(event(chunk)) for chunk in chunks] + ([end] if end else [])
+    return "".join(f"data: {line}\r\n\r\n" for line in data).encode("utf-8")
+
+
+class MockGemini:
+    """
+    Local stand-in of Gemini generateContent and streamGenerateContent endpoints with configurable latency.
+    Also answers OpenAI-compatible chat/completions. Use as context manager, the server is run in background thread
+    """
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        """
+        Initialize MockGemini
+        :param latency: delay of every answer in seconds
+        :param port: port to listen, 0 - any free port
+        """
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Base url to pass to AIRequester"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1/models/"
+
+    @property
+    def openai_url(self) -> str:
+        """Base url to pass to OpenAIBackend"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1/"
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with mock._lock:
+                    mock.requests += 1
+                time.sleep(mock.latency)
+                if ":streamGenerateContent" in self.path:
+                    content_type, data = "text/event-stream", _events(answer(body))
+                elif ":generateContent" in self.path:
+                    content_type, data = "application/json", json.dumps(_candidate(answer(body))).encode("utf-8")
+                elif self.path.endswith("/chat/completions") and body.get("stream"):
+                    content_type, data = "text/event-stream", _events(_chat_answer(body), event=_delta, end="[DONE]")
+                elif self.path.endswith("/chat/completions"):
+                    content_type, data = "application/json", json.dumps(_completion(_chat_answer(body))).encode("utf-8")
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def __enter__(self) -> 'MockGemini':
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
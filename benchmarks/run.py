@@ -0,0 +1,178 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from benchmarks.corpus import generate_module, write_corpus
+from benchmarks.mock_server import MockGemini, answer
+from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.code_changer import CodeChanger
+from fiit_docgen.console import DocGen
+from fiit_docgen.parser import PARSERS
+from fiit_docgen.records import PosWithBody, PosWithDoc
+
+Report = dict[str, Any]
+
+
+def measure(function: Callable[[], object], setup: Callable[[], object] | None = None, repeat: int = 3) -> Report:
+    """
+    Measure time of function
+    :param function: measured function
+    :param setup: function called before every run, its time is not measured
+    :param repeat: count of runs
+    :return: median, minimum and all times in seconds
+    """
+    times: list[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(times), "min": min(times), "runs": times}
+
+
+def _parse(backend: str, path: Path) -> dict[str, PosWithBody]:
+    return PARSERS[backend](str(path)).parse_from_file(str(path))
+
+
+def _docs(objects: dict[str, PosWithBody]) -> dict[str, PosWithDoc]:
+    return {
+        key: PosWithDoc(value.position, "Generated documentation\n:param first: Argument", value.source)
+        for key, value in objects.items()
+    }
+
+
+def run_benchmarks(
+    directory: Path, functions: int, files: int, latency: float, repeat: int, validate_objects: int
+) -> Report:
+    """
+    Run all benchmarks on generated corpus
+    :param directory: working directory for generated code
+    :param functions: count of functions in module and in project
+    :param files: count of modules in project for end-to-end run
+    :param latency: latency of mock AI in seconds
+    :param repeat: count of runs of every benchmark
+    :param validate_objects: count of objects in one answer of AI for validation benchmark
+    :return: report
+    """
+    module = directory / "module.py"
+    code = generate_module(functions)
+    module.write_text(code, encoding="utf-8")
+    results: Report = {}
+
+    for backend in sorted(PARSERS):
+        results[f"parse_{backend}"] = measure(lambda: _parse(backend, module), repeat=repeat)
+    objects = _parse("ast", module)
+    results["parse_ast"]["objects"] = len(objects)
+
+    def write_module() -> None:
+        module.write_text(code, encoding="utf-8")
+
+    def process_files() -> None:
+        CodeChanger().process_files(_docs(_parse("ast", module)))
+
+    results["process_files"] = measure(process_files, write_module, repeat)
+
+    validated = dict(list(objects.items())[:validate_objects])
+    outer_code = [validated[key].text for key in AIRequester._group_outer_objects(list(validated))]
+    text = answer({"contents": [{"parts": [{"text": body} for body in outer_code]}]})
+    requester = AIRequester(validated)
+    results["validate_docs"] = measure(lambda: requester._validate_docs(text, validated), repeat=repeat)
+    results["validate_docs"]["objects"] = len(validated)
+
+    project = directory / "project"
+
+    def write_project() -> None:
+        shutil.rmtree(project, ignore_errors=True)
+        write_corpus(project, files, functions)
+
+    with MockGemini(latency) as mock:
+        argv = ["docgen", str(project), "--api-key", "benchmark", "--url", mock.url, "--no-cache"]
+
+        def run_docgen() -> None:
+            with contextlib.redirect_stdout(io.StringIO()), _patched_argv(argv):
+                try:
+                    DocGen().run()
+                except SystemExit as e:
+                    if e.code:
+                        raise RuntimeError(f"DocGen exited with code {e.code}") from e
+
+        results["docgen_run"] = measure(run_docgen, write_project, repeat)
+        results["docgen_run"]["requests"] = mock.requests // repeat
+
+    return results
+
+
+@contextlib.contextmanager
+def _patched_argv(argv: list[str]) -> Iterator[None]:
+    saved = sys.argv
+    sys.argv = argv
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+
+def compare(results: Report, baseline: Report, tolerance: float) -> list[str]:
+    """
+    Compare results with baseline report
+    :param results: current results
+    :param baseline: results of baseline report
+    :param tolerance: allowed slowdown, 0.2 means 20%
+    :return: descriptions of regressions
+    """
+    regressions: list[str] = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["seconds"], result["seconds"]
+        if after > before * (1 + tolerance):
+            regressions.append(f"{name}: {before:.3f}s -> {after:.3f}s")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DocGen benchmarks on synthetic code with local mock of Gemini")
+    parser.add_argument("--functions", type=int, default=10000, help="Functions in module and in project")
+    parser.add_argument("--files", type=int, default=20, help="Modules in project for end-to-end run")
+    parser.add_argument("--validate-objects", type=int, default=2000, help="Objects in one answer to validate")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of mock AI in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every benchmark")
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"), help="Path of JSON report")
+    parser.add_argument("--baseline", type=Path, help="JSON report to compare with, exits with 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(
+            Path(directory), args.functions, args.files, args.latency, args.repeat, args.validate_objects
+        )
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {key: str(value) for key, value in vars(args).items()},
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    for name, result in results.items():
+        print(f"{name:<16}{result['seconds']:>10.3f}s")
+    print(f"Report saved to {args.output}")
+
+    if args.baseline is not None:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8"))["results"], args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
@@ -1,54 +1,449 @@
-﻿import sys
+﻿import asyncio
+import contextlib
+import json
+from typing import Any, AsyncGenerator, Callable, Iterator
 
-from fiit_docgen.records import BaseAIRequester, PosWithBody, PosWithDoc
-from requests import post
+from fiit_docgen.backends import GEMINI_URL, Backend, GeminiBackend
+from fiit_docgen.batcher import DEFAULT_BATCH_TOKENS
+from fiit_docgen.cache import DocCache
+from fiit_docgen.code_changer import CodeChanger
+from fiit_docgen.compaction import Compactor
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.records import BaseAIRequester, Batch, PosWithBody, PosWithDoc, RequestBody
+from fiit_docgen.scheduler import DEFAULT_CONCURRENCY, RateLimiter
+from fiit_docgen.transport import HttpTransport, MeteredTransport, Transport
+
+DEFAULT_URL = GEMINI_URL
+
+
+class ObjectNameIndex:
+    """
+    Index of objects of batch by names, which AI writes in answer ('Class/method' or just 'method').
+    Built once per answer, so every name is found in O(1) instead of scanning all objects.
+    Ambiguous names (same methods in different classes or files) are resolved deterministically:
+    the first object in order of parsing, which is not documented yet, with exact qualified name,
+    then with name ending by it
+    """
+
+    def __init__(self, objects: dict[str, PosWithBody]):
+        """
+        Initialize ObjectNameIndex
+        :param objects: objects of batch in order of parsing
+        """
+        self._qualified: dict[str, list[str]] = {}
+        self._tails: dict[str, list[str]] = {}
+        # Position of the first not documented object in every list
+        self._next: dict[tuple[bool, str], int] = {}
+
+        for key, value in objects.items():
+            file_path = value.source.path if value.source is not None else CodeChanger._file_of_key(key)
+            qualified = key[len(file_path) + 1 :] if key.startswith(f"{file_path}/") else key
+            self._qualified.setdefault(qualified, []).append(key)
+            parts = qualified.split("/")
+            for i in range(len(parts)):
+                self._tails.setdefault("/".join(parts[i:]), []).append(key)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tails
+
+    @property
+    def qualified_names(self) -> list[str]:
+        """Names of objects of batch relative to their files, in order of parsing"""
+        return list(self._qualified)
+
+    def find(self, name: str, documented: dict[str, PosWithDoc]) -> str | None:
+        """
+        Find object to document by name from main line of answer
+        :param name: name written by AI
+        :param documented: objects already documented in this answer
+        :return: object or None
+        """
+        name = self._known(name)
+        if name not in self._tails:
+            return None
+        for exact, keys in ((True, self._qualified.get(name, [])), (False, self._tails[name])):
+            i = self._next.get((exact, name), 0)
+            while i < len(keys) and keys[i] in documented:
+                i += 1
+            self._next[(exact, name)] = i
+            if i < len(keys):
+                return keys[i]
+        # All objects with this name are documented, AI repeated the name
+        return self._qualified.get(name, self._tails[name])[0]
+
+    def find_documented(self, name: str, documented: dict[str, PosWithDoc], last: str | None) -> str | None:
+        """
+        Find already documented object by name from line of param or return
+        :param name: name of object written by AI
+        :param documented: objects already documented in this answer
+        :param last: object documented by previous main line, params are written right after it
+        :return: object or None
+        """
+        name = self._known(name)
+        keys = self._tails.get(name, [])
+        if last is not None and last in keys:
+            return last
+        exact = [key for key in self._qualified.get(name, []) if key in documented]
+        return exact[-1] if exact else next((key for key in keys if key in documented), None)
+
+    def _known(self, name: str) -> str:
+        """Strip prefix written by AI before the name (for example, name of module)"""
+        while name not in self._tails and "/" in name:
+            name = name.split("/", 1)[1]
+        return name
+
+
+class DocLineParser:
+    """
+    Parses answer of AI line by line, answer can be fed in chunks as it arrives.
+    Documentation of object is complete when line of other object begins, because SYS_INSTRUCTION asks
+    to write params and return right after object. Params coming later are kept only in result
+    """
+
+    def __init__(self, objects: dict[str, PosWithBody]):
+        """
+        Initialize DocLineParser
+        :param objects: objects of batch
+        """
+        self._objects = objects
+        self._index = ObjectNameIndex(objects)
+        self._buffer = ""
+        self._pending: str | None = None
+        self.result: dict[str, PosWithDoc] = {}
+
+    def feed(self, text: str) -> list[tuple[str, PosWithDoc]]:
+        """
+        Add chunk of answer
+        :param text: chunk of answer
+        :return: pairs of object and its doc, which were completed by chunk
+        """
+        lines = (self._buffer + text).split("\n")
+        self._buffer = lines.pop()
+        completed: list[tuple[str, PosWithDoc]] = []
+        for line in lines:
+            completed += self._parse_line(line)
+        return completed
+
+    def close(self) -> list[tuple[str, PosWithDoc]]:
+        """
+        Finish answer
+        :return: pairs of object and its doc, which were not returned yet
+        """
+        completed = self._parse_line(self._buffer)
+        self._buffer = ""
+        return completed + self._flush()
+
+    def _flush(self) -> list[tuple[str, PosWithDoc]]:
+        if self._pending is None:
+            return []
+        pending, self._pending = self._pending, None
+        return [(pending, self.result[pending])]
+
+    def _parse_line(self, line: str) -> list[tuple[str, PosWithDoc]]:
+        if line.strip() == "" or ":" not in line:
+            return []
+
+        object_name, object_doc = map(str.strip, line.split(":", 1))
+        true_object_name, _, argument = object_name.rpartition("/")
+
+        if true_object_name and argument.startswith(("param", "return")) and object_name not in self._index:
+            object_path = self._index.find_documented(true_object_name, self.result, self._pending)
+            if object_path is not None:
+                doc = self.result[object_path].Documentation + f"\n:{argument}: {object_doc}"
+                self.result[object_path] = self.result[object_path]._replace(Documentation=doc)
+            return []
+
+        object_path = self._index.find(object_name, self.result)
+        if object_path is None:
+            return []
+        value = self._objects[object_path]
+        self.result[object_path] = PosWithDoc(value.position, object_doc, value.source)
+        completed = self._flush() if self._pending != object_path else []
+        self._pending = object_path
+        return completed
+
+
+class JsonDocParser:
+    """
+    Parses answer of AI in JSON mode: array of objects by schema of AIRequester.
+    Answer can be fed in chunks as it arrives, every element of array is decoded as soon as it is complete
+    """
+
+    def __init__(self, objects: dict[str, PosWithBody]):
+        """
+        Initialize JsonDocParser
+        :param objects: objects of batch
+        """
+        self._objects = objects
+        self._index = ObjectNameIndex(objects)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self.result: dict[str, PosWithDoc] = {}
+
+    def feed(self, text: str) -> list[tuple[str, PosWithDoc]]:
+        """
+        Add chunk of answer
+        :param text: chunk of answer
+        :return: pairs of object and its doc, which were completed by chunk
+        """
+        self._buffer += text
+        completed: list[tuple[str, PosWithDoc]] = []
+        while True:
+            # Skip beginning of array and separators of its elements
+            start = len(self._buffer) - len(self._buffer.lstrip(" \t\r\n[,"))
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, start)
+            except json.JSONDecodeError:
+                return completed
+            self._buffer = self._buffer[end:]
+            completed += self._parse_item(item)
+
+    def close(self) -> list[tuple[str, PosWithDoc]]:
+        """
+        Finish answer, incomplete element is dropped
+        :return: pairs of object and its doc, which were not returned yet
+        """
+        completed = self.feed("")
+        self._buffer = ""
+        return completed
+
+    def _parse_item(self, item: Any) -> list[tuple[str, PosWithDoc]]:
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            return []
+        object_path = self._index.find(item["path"], self.result)
+        if object_path is None:
+            return []
+
+        doc = str(item.get("description", ""))
+        for param in item.get("params") or []:
+            if isinstance(param, dict) and "name" in param:
+                doc += f"\n:param {param['name']}: {param.get('description', '')}"
+        if item.get("return"):
+            doc += f"\n:return: {item['return']}"
+        value = self._objects[object_path]
+        self.result[object_path] = PosWithDoc(value.position, doc, value.source)
+        return [(object_path, self.result[object_path])]
 
 
 class AIRequester(BaseAIRequester):
+    JSON_INSTRUCTION = (
+        "Ты помощник по программированию. Я буду давать тебе часть кода, а твоя задача проанализировать "
+        "данный код и написать краткую документацию для каждого класса, функции и метода, в том числе вложенных. "
+        "Ответ верни в виде JSON-массива, по одному элементу на каждый объект: в 'path' напиши путь объекта "
+        "в виде 'имя этого класса'/'имя этой функции или метода' (для объектов верхнего уровня только имя), "
+        "в 'description' - что данный класс делает или что данный код делает, в 'params' - для каждого "
+        "аргумента его имя 'name' и зачем он нужен 'description', в 'return' - что возвращает данный код "
+        "(не указывай 'return', если ничего не возвращается). Пиши документацию только с использованием "
+        "символов ASCII и только на английском языке"
+    )
+    # Increase on every change of JSON_INSTRUCTION or schema to invalidate cached documentation
+    JSON_INSTRUCTION_VERSION = "json-1"
+
     def __init__(
         self,
         objects_to_doc: dict[str, PosWithBody],
-        url: str = "https://weathered-truth-4ce8.alexspirin.workers.dev/v1/models/",
+        url: str = DEFAULT_URL,
         model: str = "gemini-2.5-flash",
         apikey: str = "",
+        cache: DocCache | None = None,
+        max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+        rate_limiter: RateLimiter | None = None,
+        pool_size: int = 1,
+        transport: Transport | None = None,
+        stream: bool = False,
+        metrics: Metrics | None = None,
+        compactor: Compactor | None = None,
+        backend: Backend | None = None,
+        json_output: bool = False,
     ):
-        super().__init__(objects_to_doc, url, model, apikey)
+        """
+        Initialize AIRequester
+        :param objects_to_doc:
+        :param url: base url of Gemini API
+        :param model: name of model, also part of keys of cache
+        :param apikey:
+        :param cache: documentation cache, objects found in it are not sent to AI
+        :param max_batch_tokens: budget of tokens of code in one request to AI
+        :param rate_limiter: client-side limiter of requests
+        :param pool_size: count of kept-alive connections
+        :param transport: transport of requests to Gemini API
+        :param stream: receive answers as stream
+        :param metrics: metrics of run
+        :param compactor: compacts code before sending to AI
+        :param backend: endpoint and model of AI, replaces url, apikey and transport (default - Gemini)
+        :param json_output: ask AI to answer in JSON by schema instead of lines of text
+        """
+        # Needed by batches and keys of cache, which are made by constructor of BaseAIRequester
+        self._json_output = json_output
+        super().__init__(objects_to_doc, url, model, apikey, cache, max_batch_tokens, rate_limiter, metrics, compactor)
+
+        # Streaming answer is parsed while it arrives, documentation of objects is got before end of answer
+        self._stream = stream
+        if backend is None:
+            # By default Session keeps connections alive between requests of batches
+            transport = MeteredTransport(transport or HttpTransport(url, pool_size), self._metrics)
+            backend = GeminiBackend(url, model, apikey, transport)
+        self._backend = backend
+
+    def _build_body(self, bodies: list[str]) -> RequestBody:
+        body = super()._build_body(bodies)
+        if self._json_output:
+            body["contents"][0] = {"role": "user", "parts": {"text": self.JSON_INSTRUCTION}}
+        return body
+
+    def _make_batch(self, keys: list[str]) -> Batch:
+        batch = super()._make_batch(keys)
+        if self._json_output:
+            batch.body["generationConfig"] = {
+                "responseMimeType": "application/json",
+                "responseSchema": self._response_schema(ObjectNameIndex(batch.objects).qualified_names),
+            }
+        return batch
 
-        self._full_url_to_ai: str = f"{url}{model}:generateContent?key={apikey}"
+    @staticmethod
+    def _response_schema(names: list[str]) -> dict[str, Any]:
+        """
+        Schema of answer in JSON mode
+        :param names: names of objects of batch, AI can write only them in path
+        :return: schema in format of Gemini API
+        """
+        text: dict[str, Any] = {"type": "STRING"}
+        param = {
+            "type": "OBJECT",
+            "properties": {"name": text, "description": text},
+            "required": ["name", "description"],
+        }
+        item = {
+            "type": "OBJECT",
+            "properties": {
+                "path": {"type": "STRING", "enum": names},
+                "description": text,
+                "params": {"type": "ARRAY", "items": param},
+                "return": text,
+            },
+            "required": ["path", "description"],
+        }
+        return {"type": "ARRAY", "items": item}
 
-    def _validate_docs(self, docs: str | None) -> dict[str, PosWithDoc] | None:
+    def _cache_key(self, outer_key: str) -> str:
+        if not self._json_output:
+            return super()._cache_key(outer_key)
+        return DocCache.make_key(self._objects_to_doc[outer_key].text, self._model_of_ai, self.JSON_INSTRUCTION_VERSION)
+
+    def _parser(self, objects: dict[str, PosWithBody]) -> DocLineParser | JsonDocParser:
+        return JsonDocParser(objects) if self._json_output else DocLineParser(objects)
+
+    def _validate_docs(self, docs: str | None, objects: dict[str, PosWithBody]) -> dict[str, PosWithDoc] | None:
         if docs is None:
             return None
 
-        result: dict[str, PosWithDoc] = {}
-        paths = sorted(list(self._objects_to_doc.keys()), key=list(self._objects_to_doc.keys()).index)
+        parser = self._parser(objects)
+        parser.feed(docs)
+        parser.close()
+        return parser.result
+
+    def _iter_docs_from_ai(
+        self, body: RequestBody, objects: dict[str, PosWithBody]
+    ) -> Iterator[tuple[str, PosWithDoc]]:
+        if not self._stream:
+            yield from super()._iter_docs_from_ai(body, objects)
+            return
+
+        chunks = self._send_with_retries(body, self._backend.stream)
+        if chunks is None:
+            return
+
+        parser = self._parser(objects)
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.close()
+
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
+        return self._backend.generate(body)
+
+
+class AsyncAIRequester(AIRequester):
+    """
+    AIRequester, which sends requests of batches concurrently.
+    Requests are sent through pool of kept-alive connections, count of requests in flight is limited
+    """
+
+    def __init__(self, objects_to_doc: dict[str, PosWithBody], concurrency: int = DEFAULT_CONCURRENCY, **kwargs: Any):
+        """
+        Initialize AsyncAIRequester
+        :param objects_to_doc:
+        :param concurrency: maximal count of requests in flight
+        :param kwargs: arguments of AIRequester
+        """
+        super().__init__(objects_to_doc, pool_size=concurrency, **kwargs)
+        self._concurrency = max(1, concurrency)
+
+    def _emit_batch_docs(self, batch: Batch, emit: Callable[[dict[str, PosWithDoc]], None]) -> None:
+        """
+        Get documentation of batch in thread and pass it to event loop
+        :param batch: batch to doc
+        :param emit: function passing documentation to event loop
+        """
+        if not self._stream:
+            emit(self._get_batch_docs(batch))
+            return
+        for key, doc in self._iter_batch_docs(batch):
+            emit({key: doc})
 
-        for doc in docs.split("\n"):
-            if doc.strip() == "" or ":" not in doc:
-                continue
+    async def _get_batch_docs_async(
+        self, batch: Batch, semaphore: asyncio.Semaphore, emit: Callable[[dict[str, PosWithDoc]], None]
+    ) -> None:
+        async with semaphore:
+            await asyncio.to_thread(self._emit_batch_docs, batch, emit)
 
-            object_name, object_doc = map(str.strip, doc.split(":", 1))
+    async def iter_docs(self) -> AsyncGenerator[dict[str, PosWithDoc], None]:
+        """
+        Get documentation in order of completion: documentation of whole batch
+        or, in streaming mode, documentation of each object as soon as it is received
+        :return: async iterator of dicts, where key object to doc, value is doc
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[dict[str, PosWithDoc] | None] = asyncio.Queue()
 
-            for object_path in paths:
-                if object_path.endswith(object_name):
-                    result[object_path] = PosWithDoc(self._objects_to_doc[object_path].position, object_doc)
-                    break
-                elif "param" in object_name or "return" in object_name:
-                    true_object_name, argument = object_name.rsplit('/', 1)
+        def emit(docs: dict[str, PosWithDoc]) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, docs)
 
-                    if object_path.endswith(true_object_name):
-                        pos = result[object_path].Position
-                        doc = result[object_path].Documentation + f"\n:{argument}: {object_doc}"
-                        result[object_path] = PosWithDoc(pos, doc)
-                        break
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks = [asyncio.create_task(self._get_batch_docs_async(batch, semaphore, emit)) for batch in self._batches]
+        done = asyncio.gather(*tasks)
+        # Callbacks run in order of scheduling, so None is put after all documentation emitted by threads
+        done.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (docs := await queue.get()) is not None:
+                yield docs
+            await done
+        finally:
+            # Consumer stopped early or run was cancelled: cancel requests and retrieve result of gather,
+            # otherwise asyncio reports that its exception was never retrieved
+            done.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await done
 
-        return result if len(result.keys()) == len(paths) else None
+    async def get_docs_async(
+        self, on_docs: Callable[[dict[str, PosWithDoc]], None] | None = None
+    ) -> dict[str, PosWithDoc]:
+        """
+        Get documentation for AsyncAIRequester
+        :param on_docs: called with documentation as soon as it is received (with cached documentation first)
+        :return: dict, where key object to doc, value is doc
+        """
+        if on_docs is not None:
+            on_docs(dict(self._cached_docs))
+        if not self._pending_objects:
+            return dict(self._cached_docs)
 
-    def _get_docs_from_ai(self) -> str | None:
-        response = post(self._full_url_to_ai, json=self._body, headers={"Content-Type": "application/json"})
+        documentation: dict[str, PosWithDoc] = {}
+        async for docs in self.iter_docs():
+            if on_docs is not None:
+                on_docs(docs)
+            documentation.update(docs)
 
-        if response.status_code == 429:
-            print(f"To many requests. Please retry again after {response.json()['error']['details'][-1]['retryDelay']}")
-            sys.exit(-1)
+        return self._merge_docs(documentation)
 
-        return response.json()["candidates"][0]["content"]["parts"][0]["text"] if response.status_code == 200 else None
+    def get_docs(self, on_docs: Callable[[dict[str, PosWithDoc]], None] | None = None) -> dict[str, PosWithDoc]:
+        return asyncio.run(self.get_docs_async(on_docs))
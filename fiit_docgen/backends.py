@@ -0,0 +1,295 @@
+import collections
+import math
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.records import RequestBody
+from fiit_docgen.scheduler import RateLimitExceeded, parse_retry_delay
+from fiit_docgen.transport import Transport, TransportResponse
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+GEMINI_URL = "https://weathered-truth-4ce8.alexspirin.workers.dev/v1/models/"
+
+
+class Backend(ABC):
+    """
+    Endpoint and model of AI. Requester builds body of request in Gemini format (contents with parts),
+    backend converts it to format of its endpoint and returns text of answer
+    """
+
+    @abstractmethod
+    def generate(self, body: RequestBody) -> str | None:
+        """
+        Send request and wait for the whole answer
+        :param body: json body of request in Gemini format
+        :return: text of answer or None
+        :raises RateLimitExceeded: if AI answered 429
+        """
+
+    @abstractmethod
+    def stream(self, body: RequestBody) -> Iterator[str] | None:
+        """
+        Send request and receive answer as stream
+        :param body: json body of request in Gemini format
+        :return: iterator of chunks of answer as they arrive or None
+        :raises RateLimitExceeded: if AI answered 429
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class HttpBackend(Backend):
+    """
+    Backend reached through transport. Inherit this class and add it to BACKENDS to support new API
+    """
+
+    DEFAULT_URL = ""
+    DEFAULT_MODEL = ""
+    # Environment variable with API key and whether API cannot be used without key
+    API_KEY_ENV = ""
+    REQUIRES_API_KEY = True
+
+    def __init__(self, url: str, model: str, apikey: str, transport: Transport):
+        """
+        Initialize HttpBackend
+        :param url: base url of API
+        :param model: name of model
+        :param apikey: key of API
+        :param transport: transport to send requests
+        """
+        self._url = url
+        self._model = model
+        self._apikey = apikey
+        self._transport = transport
+
+    @staticmethod
+    def _check(response: TransportResponse) -> bool:
+        """
+        :return: True if answer is successful
+        :raises RateLimitExceeded: if AI answered 429
+        """
+        if response.status_code == 429:
+            raise RateLimitExceeded(HttpBackend._get_retry_delay(response.body))
+        return response.status_code == 200
+
+    @staticmethod
+    def _get_retry_delay(error: Any) -> float | None:
+        """
+        Get retryDelay from body of 429 answer (in format of Google API)
+        :param error: json body of answer
+        :return: delay in seconds or None if server did not send it
+        """
+        try:
+            details = error["error"]["details"]
+        except (KeyError, TypeError):
+            return None
+        for detail in reversed(details):
+            if isinstance(detail, dict) and "retryDelay" in detail:
+                return parse_retry_delay(detail["retryDelay"])
+        return None
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class GeminiBackend(HttpBackend):
+    """Gemini API: generateContent and streamGenerateContent"""
+
+    DEFAULT_URL = GEMINI_URL
+    DEFAULT_MODEL = "gemini-2.5-flash"
+    API_KEY_ENV = "GEMINI_API_KEY"
+
+    def generate(self, body: RequestBody) -> str | None:
+        response = self._transport.post(f"{self._url}{self._model}:generateContent?key={self._apikey}", body)
+        if not self._check(response):
+            return None
+        return str(response.body["candidates"][0]["content"]["parts"][0]["text"])
+
+    def stream(self, body: RequestBody) -> Iterator[str] | None:
+        url = f"{self._url}{self._model}:streamGenerateContent?alt=sse&key={self._apikey}"
+        response = self._transport.stream(url, body)
+        return self._stream_texts(response.body) if self._check(response) else None
+
+    @staticmethod
+    def _stream_texts(events: Iterator[Any]) -> Iterator[str]:
+        """Get text from events of stream, last event may contain only finishReason"""
+        for event in events:
+            for candidate in event.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    yield part.get("text", "")
+
+
+class OpenAIBackend(HttpBackend):
+    """OpenAI-compatible chat completions API (OpenAI, vLLM, llama.cpp server, Ollama)"""
+
+    DEFAULT_URL = "http://127.0.0.1:8080/v1/"
+    DEFAULT_MODEL = "default"
+    API_KEY_ENV = "OPENAI_API_KEY"
+    # Local servers usually do not check key
+    REQUIRES_API_KEY = False
+
+    def generate(self, body: RequestBody) -> str | None:
+        response = self._transport.post(f"{self._url}chat/completions", self._convert(body), self._headers())
+        if not self._check(response):
+            return None
+        return str(response.body["choices"][0]["message"]["content"])
+
+    def stream(self, body: RequestBody) -> Iterator[str] | None:
+        response = self._transport.stream(
+            f"{self._url}chat/completions", {**self._convert(body), "stream": True}, self._headers()
+        )
+        return self._stream_texts(response.body) if self._check(response) else None
+
+    @staticmethod
+    def _stream_texts(events: Iterator[Any]) -> Iterator[str]:
+        for event in events:
+            for choice in event.get("choices", [])[:1]:
+                yield choice.get("delta", {}).get("content") or ""
+
+    def _headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self._apikey}"} if self._apikey else {}
+
+    def _convert(self, body: RequestBody) -> RequestBody:
+        """
+        Convert body in Gemini format to chat completion: the first content is system message,
+        parts of other contents become parts of user messages, schema of answer becomes response_format
+        """
+        messages: list[dict[str, Any]] = []
+        for i, content in enumerate(body["contents"]):
+            parts = content["parts"] if isinstance(content["parts"], list) else [content["parts"]]
+            if i == 0:
+                messages.append({"role": "system", "content": "\n".join(part["text"] for part in parts)})
+            else:
+                messages.append({"role": "user", "content": [{"type": "text", "text": part["text"]} for part in parts]})
+        result: RequestBody = {"model": self._model, "messages": messages}
+        config = body.get("generationConfig", {})
+        if "responseSchema" in config:
+            schema = {"name": "documentation", "schema": self._json_schema(config["responseSchema"])}
+            result["response_format"] = {"type": "json_schema", "json_schema": schema}
+        elif config.get("responseMimeType") == "application/json":
+            result["response_format"] = {"type": "json_object"}
+        return result
+
+    @classmethod
+    def _json_schema(cls, schema: Any) -> Any:
+        """Convert schema of Gemini API (types in upper case) to JSON Schema"""
+        if isinstance(schema, list):
+            return [cls._json_schema(item) for item in schema]
+        if not isinstance(schema, dict):
+            return schema
+        return {
+            key: value.lower() if key == "type" and isinstance(value, str) else cls._json_schema(value)
+            for key, value in schema.items()
+        }
+
+
+BACKENDS: dict[str, type[HttpBackend]] = {'gemini': GeminiBackend, 'openai': OpenAIBackend}
+
+
+class HedgedBackend(Backend):
+    """
+    Sends request to primary backend. If it does not answer within deadline (p95 of its latency),
+    sends the same request to secondary backend and takes the answer, which comes first.
+    Streaming requests are sent only to primary backend
+    """
+
+    def __init__(
+        self,
+        primary: Backend,
+        secondary: Backend,
+        quantile: float = 0.95,
+        min_samples: int = 5,
+        initial_deadline: float | None = None,
+        max_workers: int = 8,
+        metrics: Metrics | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize HedgedBackend
+        :param primary: backend to send all requests
+        :param secondary: backend to send slow requests again
+        :param quantile: quantile of latency of primary backend used as deadline
+        :param min_samples: count of answers of primary backend needed to compute deadline
+        :param initial_deadline: deadline until latency is known, None - do not hedge until then
+        :param max_workers: count of threads sending requests
+        :param metrics: metrics of run, collects count of hedged requests and wins of secondary backend
+        :param clock: monotonic clock
+        """
+        self._primary = primary
+        self._secondary = secondary
+        self._quantile = quantile
+        self._min_samples = min_samples
+        self._initial_deadline = initial_deadline
+        self._metrics = metrics or Metrics()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies: collections.deque[float] = collections.deque(maxlen=200)
+
+        # concurrent.futures is imported only when hedging is used, so runs without it start faster
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    def deadline(self) -> float | None:
+        """
+        Time to wait for primary backend before hedging
+        :return: deadline in seconds or None, if request should not be hedged
+        """
+        with self._lock:
+            if len(self._latencies) < self._min_samples:
+                return self._initial_deadline
+            latencies = sorted(self._latencies)
+        return latencies[max(0, math.ceil(self._quantile * len(latencies)) - 1)]
+
+    def _timed_primary(self, body: RequestBody) -> str | None:
+        start = self._clock()
+        try:
+            return self._primary.generate(body)
+        finally:
+            with self._lock:
+                self._latencies.append(self._clock() - start)
+
+    def generate(self, body: RequestBody) -> str | None:
+        # Futures are put here in order of completion
+        completed: queue.SimpleQueue['Future[str | None]'] = queue.SimpleQueue()
+        primary = self._executor.submit(self._timed_primary, body)
+        primary.add_done_callback(completed.put)
+        try:
+            completed.get(timeout=self.deadline())
+            return primary.result()
+        except queue.Empty:
+            pass
+
+        self._metrics.add("hedged_requests")
+        secondary = self._executor.submit(self._secondary.generate, body)
+        secondary.add_done_callback(completed.put)
+        error: Exception | None = None
+        for _ in range(2):
+            future = completed.get()
+            try:
+                result = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if result is not None:
+                if future is secondary:
+                    self._metrics.add("hedge_wins")
+                return result
+        if error is not None:
+            raise error
+        return None
+
+    def stream(self, body: RequestBody) -> Iterator[str] | None:
+        return self._primary.stream(body)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._primary.close()
+        self._secondary.close()
@@ -0,0 +1,47 @@
+DEFAULT_BATCH_TOKENS = 16000
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough estimation of count of tokens in text (about 4 bytes per token)
+    :param text: text to estimate
+    :return: count of tokens
+    """
+    return len(text.encode('utf-8')) // 4 + 1
+
+
+class Batcher:
+    """
+    Splits outer objects into batches, each of them is sent to AI in separate request.
+    Outer object is never split, so class is always sent together with its methods
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_BATCH_TOKENS):
+        """
+        Initialize Batcher
+        :param max_tokens: budget of tokens of code in one batch
+        """
+        self._max_tokens = max_tokens
+
+    def split(self, bodies: dict[str, str]) -> list[list[str]]:
+        """
+        Split outer objects into batches under budget
+        :param bodies: dict, where key is outer object, value is its code
+        :return: list of batches of outer objects, outer object bigger than budget gets its own batch
+        """
+        batches: list[list[str]] = []
+        current: list[str] = []
+        current_tokens = 0
+
+        for key, body in bodies.items():
+            tokens = estimate_tokens(body)
+            if current and current_tokens + tokens > self._max_tokens:
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(key)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
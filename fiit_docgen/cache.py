@@ -0,0 +1,121 @@
+import hashlib
+import json
+import textwrap
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path('.docgen')
+
+
+def normalize_body(body: str) -> str:
+    """
+    Normalize code so formatting-only differences give the same key
+    :param body: source code of object
+    :return: dedented code without trailing whitespace and blank lines
+    """
+    lines = [line.rstrip() for line in body.splitlines()]
+    return textwrap.dedent('\n'.join(line for line in lines if line))
+
+
+def fingerprint(body: str) -> str:
+    """
+    Hash of normalized code of object
+    :param body: source code of object
+    :return: hex digest
+    """
+    return hashlib.sha256(normalize_body(body).encode('utf-8')).hexdigest()
+
+
+class DocCache:
+    """
+    Persistent documentation cache stored in SQLite database.
+    Each entry keeps documentation of one outer object and its inner objects by their relative paths
+    """
+
+    FILE_NAME = 'cache.sqlite3'
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_CACHE_DIR,
+        max_entries: int = 50000,
+        max_age_days: float = 180,
+        refresh: bool = False,
+    ):
+        """
+        Open (or create) cache and evict stale entries
+        :param directory: directory to store database in
+        :param max_entries: maximal count of entries, least recently used entries are evicted first
+        :param max_age_days: entries which were not used for this count of days are evicted
+        :param refresh: entries are not read, only written (documentation is regenerated and replaces cached one)
+        """
+        import sqlite3
+
+        self._refresh = refresh
+        directory.mkdir(parents=True, exist_ok=True)
+        self._max_entries = max_entries
+        self._max_age = max_age_days * 24 * 60 * 60
+        self._connection = sqlite3.connect(directory / self.FILE_NAME)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS docs "
+            "(key TEXT PRIMARY KEY, docs TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.evict()
+
+    @staticmethod
+    def make_key(body: str, model: str, version: str) -> str:
+        """
+        Make cache key of object
+        :param body: source code of outer object
+        :param model: name of AI model
+        :param version: version of system instruction
+        :return: key of cache entry
+        """
+        return hashlib.sha256(f"{model}\0{version}\0{fingerprint(body)}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> dict[str, str] | None:
+        """
+        Get documentation from cache
+        :param key: key of cache entry
+        :return: dict, where key is relative path of object, value is doc or None if there is no entry
+        """
+        if self._refresh:
+            return None
+        row = self._connection.execute("SELECT docs FROM docs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self._connection:
+            self._connection.execute("UPDATE docs SET last_used = ? WHERE key = ?", (time.time(), key))
+        docs: dict[str, str] = json.loads(row[0])
+        return docs
+
+    def put(self, key: str, docs: dict[str, str]) -> None:
+        """
+        Put documentation to cache
+        :param key: key of cache entry
+        :param docs: dict, where key is relative path of object, value is doc
+        """
+        now = time.time()
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO docs (key, docs, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(docs), now, now),
+            )
+
+    def evict(self) -> None:
+        """
+        Remove entries older than max age and least recently used entries above max count
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM docs WHERE last_used < ?", (time.time() - self._max_age,))
+            self._connection.execute(
+                "DELETE FROM docs WHERE key NOT IN (SELECT key FROM docs ORDER BY last_used DESC LIMIT ?)",
+                (self._max_entries,),
+            )
+
+    def __len__(self) -> int:
+        count: int = self._connection.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        return count
+
+    def close(self) -> None:
+        self.evict()
+        self._connection.close()
@@ -1,4 +1,46 @@
-from fiit_docgen.records import Element, Position, PosWithDoc
+import ast
+import os
+import re
+
+from fiit_docgen.records import Definition, Edit, Element, FileResult, Position, PosWithDoc, Span
+from fiit_docgen.source import SourceFile, SourceFileChanged
+
+
+class DefinitionIndex:
+    """
+    Индекс определений одного файла. Для строки начала определения один раз находит конец заголовка,
+    границы docstring и признак сгенерированной документации, дальше отвечает из словаря.
+    Если позиция уже содержит эти данные (парсер на основе ast), строки не сканируются
+    """
+
+    def __init__(self, lines: list[str]):
+        self._lines = lines
+        self._definitions: dict[int, Definition] = {}
+
+    def get(self, position: Position) -> Definition:
+        """Возвращает описание определения, начинающегося на position.start_line"""
+        definition = self._definitions.get(position.start_line)
+        if definition is None:
+            definition = self._build(position)
+            self._definitions[position.start_line] = definition
+        return definition
+
+    def _build(self, position: Position) -> Definition:
+        if position.header_end >= 0:
+            header_end, doc_start, doc_end = position.header_end, position.doc_start, position.doc_end
+            body_indent = position.body_indent
+        else:
+            header_end = CodeChanger._find_end_of_definition(self._lines, position.start_line)
+            docstring = None
+            if CodeChanger._starts_with_docstring(self._lines, header_end):
+                docstring = CodeChanger._find_docstring(self._lines, header_end)
+            doc_start, doc_end = docstring if docstring is not None else (-1, -1)
+            body_indent = CodeChanger._find_body_indent(self._lines, header_end, position.pos)
+
+        generated = doc_start >= 0 and any(
+            CodeChanger.GENERATION_MARKER in line for line in self._lines[doc_start : doc_end + 1]
+        )
+        return Definition(header_end, doc_start, doc_end, generated, body_indent)
 
 
 class CodeChanger:
@@ -12,19 +54,69 @@ class CodeChanger:
     }
     """
     GENERATION_MARKER = "Generated documentation"
+    FILE_KEY_PATTERN = re.compile(r'^(.+?\.pyi?)/')
+
+    # Статусы обработки файла
+    WRITTEN = "written"
+    DOCUMENTED = "documented"
+    UNCHANGED = "unchanged"
+    NOT_FOUND = "not_found"
+    CHANGED = "changed"
+    FAILED = "failed"
+    MESSAGES = {
+        WRITTEN: "Документация добавлена в {path}",
+        DOCUMENTED: "Файл {path} уже содержит документацию",
+        UNCHANGED: "Файл {path} не изменился",
+        NOT_FOUND: "Файл не найден: {path}",
+        CHANGED: "Файл {path} изменился после парсинга, документация не добавлена",
+        FAILED: "Ошибка при обработке {path}: {error}",
+    }
 
-    def __init__(self, config: dict[str, str] | None = None, regen: bool = False):
+    def __init__(self, config: dict[str, str] | None = None, regen: bool = False, jobs: int | None = None):
         # config - настройки программы (в будущем)
         self.config = config or {}
         self.regen = regen
+        # jobs - количество потоков записи файлов, по умолчанию - количество ядер
+        self.jobs = jobs
 
-    def process_files(self, ai_data: dict[str, PosWithDoc]) -> None:
-        """Основной метод для обработки всех файлов"""
-        converted_data = self._convert_ai_data(ai_data)
-        files_data = self._group_by_files(converted_data)
+    def process_files(self, ai_data: dict[str, PosWithDoc]) -> list[FileResult]:
+        """
+        Основной метод для обработки всех файлов. Файлы независимы и обрабатываются в пуле потоков
+        :return: результаты обработки файлов в порядке первых объектов файлов в ai_data
+        """
+        files_data: dict[str, list[Element]] = {}
+        sources: dict[str, SourceFile] = {}
+        without_source: dict[str, PosWithDoc] = {}
 
-        for file_path, elements in files_data.items():
-            self._process_single_file(file_path, elements)
+        # Файлы, прочитанные парсером, группируются по SourceFile без разбора ключей
+        for key, value in ai_data.items():
+            if value.Source is None:
+                without_source[key] = value
+                continue
+            sources[value.Source.path] = value.Source
+            files_data.setdefault(value.Source.path, []).append(
+                {'key': key, 'position': value.Position, 'docstring': value.Documentation}
+            )
+
+        for file_path, elements in self._group_by_files(self._convert_ai_data(without_source)).items():
+            files_data.setdefault(file_path, []).extend(elements)
+
+        def process(item: tuple[str, list[Element]]) -> FileResult:
+            return self._process_single_file(item[0], item[1], sources.get(item[0]))
+
+        workers = min(self.jobs or os.cpu_count() or 1, len(files_data))
+        if workers <= 1:
+            return [process(item) for item in files_data.items()]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='docgen-write') as executor:
+            return list(executor.map(process, files_data.items()))
+
+    @staticmethod
+    def describe(result: FileResult) -> str:
+        """Сообщение для пользователя о результате обработки файла"""
+        return CodeChanger.MESSAGES[result.status].format(path=result.path, error=result.error)
 
     @staticmethod
     def _convert_ai_data(ai_data: dict[str, PosWithDoc]) -> dict[str, tuple[Position, str]]:
@@ -37,7 +129,7 @@ class CodeChanger:
         files_data: dict[str, list[Element]] = {}
 
         for key, (position, docstring) in ai_data.items():
-            file_path = key.split('/')[0]
+            file_path = CodeChanger._file_of_key(key)
 
             if file_path not in files_data:
                 files_data[file_path] = []
@@ -46,79 +138,98 @@ class CodeChanger:
 
         return files_data
 
-    def _process_single_file(self, file_path: str, elements: list[Element]) -> None:
-        """Обрабатывает один файл"""
+    @staticmethod
+    def _file_of_key(key: str) -> str:
+        """Выделяет путь к файлу из ключа вида 'path/to/file.py/ClassName/method_name'"""
+        match = CodeChanger.FILE_KEY_PATTERN.match(key)
+        if match:
+            return match.group(1)
+
+        # Файл без расширения .py: ищем самый длинный префикс, который является файлом
+        parts = key.split('/')
+        for i in range(len(parts) - 1, 0, -1):
+            candidate = '/'.join(parts[:i])
+            if os.path.isfile(candidate):
+                return candidate
+        return parts[0]
+
+    def _process_single_file(
+        self, file_path: str, elements: list[Element], source: SourceFile | None = None
+    ) -> FileResult:
+        """Обрабатывает один файл. Файл перезаписывается атомарно и только если его содержимое изменилось"""
         try:
-            lines = self._read_file(file_path)
+            source = source or SourceFile.read(file_path)
+            lines = source.lines
+            index = DefinitionIndex(lines)
 
-            # Сортируем по убыванию start_line (будем вставлять док., начиная с конца файла, чтобы позиция не измен.)
-            elements.sort(key=lambda x: x['position'].start_line, reverse=True)
-
-            modified = False
+            # Все правки считаются по исходным строкам и применяются за один проход
+            edits: list[Edit] = []
             for element in elements:
                 position: Position = element['position']
                 docstring: str = element['docstring']
 
                 if self.regen:
                     # Заменяем только сгенерированную документацию и вставляем где ее нет
-                    if CodeChanger.has_existing_docstring(lines, position):
-                        if CodeChanger.is_generated_docstring(lines, position):
-                            lines = self._replace_docstring(lines, position, docstring)
-                            modified = True
+                    if CodeChanger.has_existing_docstring(lines, position, index):
+                        if CodeChanger.is_generated_docstring(lines, position, index):
+                            edits.extend(self._docstring_edits(lines, position, docstring, True, index))
                     else:
-                        lines = self._insert_docstring(lines, position, docstring)
-                        modified = True
+                        edits.extend(self._docstring_edits(lines, position, docstring, index=index))
                 else:
-                    if not CodeChanger.has_existing_docstring(lines, position):
-                        lines = self._insert_docstring(lines, position, docstring)
-                        modified = True
-
-            if modified:
-                self._write_file(file_path, lines)
-                print(f"Документация добавлена в {file_path}")
-            else:
-                print(f"Файл {file_path} уже содержит документацию")
+                    if not CodeChanger.has_existing_docstring(lines, position, index):
+                        edits.extend(self._docstring_edits(lines, position, docstring, index=index))
+
+            if not edits:
+                return FileResult(file_path, self.DOCUMENTED)
+            new_lines = self._apply_edits(lines, edits)
+            # Например, при регенерации той же документации
+            if new_lines == lines:
+                return FileResult(file_path, self.UNCHANGED)
+            error = self._syntax_error(lines, new_lines)
+            if error:
+                return FileResult(file_path, self.FAILED, error)
+            source.write(new_lines)
+            return FileResult(file_path, self.WRITTEN)
 
         except FileNotFoundError:
-            print(f"Файл не найден: {file_path}")
+            return FileResult(file_path, self.NOT_FOUND)
+        except SourceFileChanged:
+            return FileResult(file_path, self.CHANGED)
         except Exception as e:
-            print(f"Ошибка при обработке {file_path}: {e}")
+            return FileResult(file_path, self.FAILED, str(e))
 
     @staticmethod
-    def is_generated_docstring(lines: list[str], position: Position) -> bool:
+    def _syntax_error(lines: list[str], new_lines: list[str]) -> str:
+        """
+        Проверяет, что код после вставки документации разбирается. Файлы, которые не разбирались
+        и до изменения (обработанные базовым парсером), не проверяются
+        """
+        try:
+            ast.parse(''.join(new_lines))
+            return ''
+        except (SyntaxError, ValueError) as e:
+            error = f"код с документацией не разбирается ({e}), файл не записан"
+        try:
+            ast.parse(''.join(lines))
+        except (SyntaxError, ValueError):
+            return ''
+        return error
+
+    @staticmethod
+    def is_generated_docstring(lines: list[str], position: Position, index: DefinitionIndex | None = None) -> bool:
         """
         Проверяет, является ли существующий docstring сгенерированным
         (содержит GENERATION_MARKER)
         """
-        start_line = position.start_line
-        end_line = CodeChanger._find_end_of_definition(lines, start_line)
-
-        for i in range(end_line + 1, min(end_line + 10, len(lines))):
-            if CodeChanger.GENERATION_MARKER in lines[i]:
-                return True
-
-            line = lines[i].strip()
-            if line and not line.startswith('#'):
-                if line.startswith(('"""', "'''")):
-                    continue
-                return False
-
-        return False
+        return (index or DefinitionIndex(lines)).get(position).generated
 
     def _replace_docstring(self, lines: list[str], position: Position, new_doc: str) -> list[str]:
         """Заменяет существующий docstring на новый"""
-        return self._insert_docstring(CodeChanger.remove_docstring(lines, position), position, new_doc)
+        return self._apply_edits(lines, self._docstring_edits(lines, position, new_doc, replace=True))
 
     @staticmethod
-    def remove_docstring(lines: list[str], position: Position, return_all_file: bool = True) -> list[str]:
-        """
-        Удаляет существующий docstring на указанной позиции
-        Возвращает новый список строк без docstring
-        """
-        start_line = position.start_line
-        end_line = position.end_line
-        definition_end_line = CodeChanger._find_end_of_definition(lines, start_line)
-
+    def _find_docstring(lines: list[str], definition_end_line: int) -> tuple[int, int] | None:
+        """Ищет docstring после определения, возвращает номера его первой и последней строки"""
         doc_start = -1
         for i in range(definition_end_line + 1, min(definition_end_line + 10, len(lines))):
             line = lines[i].strip()
@@ -127,7 +238,7 @@ class CodeChanger:
                 break
 
         if doc_start == -1:
-            return lines if return_all_file else lines[start_line:end_line]
+            return None
 
         quote_type = lines[doc_start].strip()[:3]
         doc_end = doc_start
@@ -139,23 +250,34 @@ class CodeChanger:
                 doc_end = i
                 break
 
-        doc_end_pos = doc_end + 1
-        if return_all_file:
-            return lines[:doc_start] + lines[doc_end_pos:]
-        body_start = doc_end + 1
-        return lines[start_line:doc_start] + lines[body_start:end_line]
+        return doc_start, doc_end
 
     @staticmethod
-    def _read_file(file_path: str) -> list[str]:
-        """Читает файл в список строк"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.readlines()
+    def remove_docstring(
+        lines: list[str], position: Position, return_all_file: bool = True, index: DefinitionIndex | None = None
+    ) -> list[str]:
+        """
+        Удаляет существующий docstring на указанной позиции
+        Возвращает новый список строк без docstring
+        """
+        if not return_all_file:
+            return [line for start, end in CodeChanger.body_spans(lines, position, index) for line in lines[start:end]]
+
+        definition = (index or DefinitionIndex(lines)).get(position)
+        if definition.doc_start < 0:
+            return lines
+        return lines[: definition.doc_start] + lines[definition.doc_end + 1 :]
 
     @staticmethod
-    def _write_file(file_path: str, lines: list[str]) -> None:
-        """Записывает файл"""
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+    def body_spans(lines: list[str], position: Position, index: DefinitionIndex | None = None) -> tuple[Span, ...]:
+        """
+        Диапазоны строк объекта (с декораторами) без docstring, строки не копируются
+        """
+        start_line, end_line = position.start_line - position.decorators, position.end_line
+        definition = (index or DefinitionIndex(lines)).get(position)
+        if definition.doc_start < 0:
+            return ((start_line, end_line),)
+        return ((start_line, definition.doc_start), (definition.doc_end + 1, end_line))
 
     @staticmethod
     def _find_end_of_definition(lines: list[str], start_line: int) -> int:
@@ -203,19 +325,27 @@ class CodeChanger:
         return start_line
 
     @staticmethod
-    def has_existing_docstring(lines: list[str], position: Position) -> bool:
-        """Проверяет, есть ли уже docstring после указанной позиции"""
-        start_line = position.start_line
-
-        if start_line >= len(lines):
-            return False
-
-        end_line = CodeChanger._find_end_of_definition(lines, start_line)
+    def _find_body_indent(lines: list[str], definition_end_line: int, pos: int) -> str:
+        """
+        Отступ первой строки кода после определения (как в файле). Пустой, если она не глубже определения:
+        тело записано в строке заголовка (def f(): return 1)
+        """
+        for i in range(definition_end_line + 1, len(lines)):
+            line = lines[i]
+            stripped = line.lstrip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            indent = len(line) - len(stripped)
+            return line[:indent] if indent > pos else ''
+        return ''
 
-        if end_line >= len(lines) - 1:
+    @staticmethod
+    def _starts_with_docstring(lines: list[str], definition_end_line: int) -> bool:
+        """Проверяет, что первая строка кода после определения - начало docstring"""
+        if definition_end_line >= len(lines) - 1:
             return False
 
-        for i in range(end_line + 1, min(end_line + 10, len(lines))):
+        for i in range(definition_end_line + 1, min(definition_end_line + 10, len(lines))):
             line = lines[i].strip()
 
             if not line or line.startswith('#'):
@@ -228,42 +358,84 @@ class CodeChanger:
 
         return False
 
+    @staticmethod
+    def has_existing_docstring(lines: list[str], position: Position, index: DefinitionIndex | None = None) -> bool:
+        """Проверяет, есть ли уже docstring после указанной позиции"""
+        if position.start_line >= len(lines):
+            return False
+
+        return (index or DefinitionIndex(lines)).get(position).doc_start >= 0
+
     def _insert_docstring(self, lines: list[str], position: Position, docstring: str) -> list[str]:
         """Вставляет docstring"""
+        return self._apply_edits(lines, self._docstring_edits(lines, position, docstring))
+
+    def _docstring_edits(
+        self,
+        lines: list[str],
+        position: Position,
+        docstring: str,
+        replace: bool = False,
+        index: DefinitionIndex | None = None,
+    ) -> list[Edit]:
+        """
+        Формирует правки для вставки docstring (и удаления старого при replace) без изменения lines
+        """
         if position.start_line >= len(lines):
-            return lines
+            return []
 
         if not docstring.strip():
-            return lines
-
-        start_line = position.start_line
-        end_line = self._find_end_of_definition(lines, start_line)
+            return []
 
-        target_line = lines[end_line]
-        indent = len(target_line) - len(target_line.lstrip())
-        indent_str = ' ' * indent
+        definition = (index or DefinitionIndex(lines)).get(position)
+        if not definition.body_indent:
+            # Тело в строке заголовка, docstring некуда вставить без переноса кода
+            return []
+        end_line = definition.header_end
 
-        formatted_docstring = self._format_docstring(docstring, indent_str)
+        # Отступ берется из тела, а не из строки заголовка (в ней может быть перенесенный аргумент)
+        formatted_docstring = self._format_docstring(docstring, definition.body_indent)
 
         end_line_pos = end_line + 1
+        if not replace or definition.doc_start < 0:
+            return [Edit(end_line_pos, end_line_pos, formatted_docstring)]
+        doc_start, doc_end = definition.doc_start, definition.doc_end
+        if doc_start == end_line_pos:
+            return [Edit(end_line_pos, doc_end + 1, formatted_docstring)]
+        return [Edit(end_line_pos, end_line_pos, formatted_docstring), Edit(doc_start, doc_end + 1, [])]
 
-        return lines[:end_line_pos] + formatted_docstring + lines[end_line_pos:]
+    @staticmethod
+    def _apply_edits(lines: list[str], edits: list[Edit]) -> list[str]:
+        """
+        Применяет правки к строкам файла за один линейный проход.
+        Каждая правка заменяет строки lines[start:end] на новые строки
+        """
+        result: list[str] = []
+        cursor = 0
+        for edit in sorted(edits, key=lambda x: (x.start, x.end)):
+            if edit.start < cursor:
+                # Пересекающаяся правка (например, один и тот же объект дважды) пропускается
+                continue
+            result.extend(lines[cursor : edit.start])
+            result.extend(edit.lines)
+            cursor = edit.end
+        result.extend(lines[cursor:])
+        return result
 
     @staticmethod
     def _format_docstring(docstring: str, indent: str) -> list[str]:
-        """Форматирует docstring с правильными отступами"""
+        """Форматирует docstring с отступом тела объекта"""
         if not docstring or not docstring.strip():
             return []
 
         docstring_lines = docstring.strip().split('\n')
         formatted_lines = []
 
-        extra_indent = '    '
-        formatted_lines.append(f'{indent}{extra_indent}"""\n')
-        formatted_lines.append(f'{indent}{extra_indent}{CodeChanger.GENERATION_MARKER}\n')
-        formatted_lines.append(f'{indent}{extra_indent}\n')
+        formatted_lines.append(f'{indent}"""\n')
+        formatted_lines.append(f'{indent}{CodeChanger.GENERATION_MARKER}\n')
+        formatted_lines.append(f'{indent}\n')
         for line in docstring_lines:
-            formatted_lines.append(f'{indent}{extra_indent}{line}\n')
-        formatted_lines.append(f'{indent}{extra_indent}"""\n')
+            formatted_lines.append(f'{indent}{line}\n')
+        formatted_lines.append(f'{indent}"""\n')
 
         return formatted_lines
@@ -0,0 +1,134 @@
+import ast
+import io
+import re
+import textwrap
+import threading
+import tokenize
+
+# Levels of compaction, every level includes previous ones
+NONE = 0
+STRIP = 1  # comments, blank lines and common indentation
+ELIDE_LITERALS = 2  # long string literals
+CAP_BODIES = 3  # middle of long functions
+LEVELS = (NONE, STRIP, ELIDE_LITERALS, CAP_BODIES)
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+STRING_PREFIX_PATTERN = re.compile(r'^([a-zA-Z]*)(\'\'\'|"""|\'|")')
+
+
+class Compactor:
+    """
+    Compacts code of objects before it is sent to AI. Comments, long literals and the middle of long
+    functions add tokens, but not information needed to write docstring. Code, which cannot be tokenized,
+    is sent as is. Counts bytes of code before and after compaction
+    """
+
+    def __init__(
+        self,
+        level: int = STRIP,
+        max_literal: int = 64,
+        max_body_lines: int = 40,
+        head_lines: int = 15,
+        tail_lines: int = 10,
+    ):
+        """
+        Initialize Compactor
+        :param level: one of LEVELS
+        :param max_literal: string literals longer than it (with quotes) are elided on level ELIDE_LITERALS
+        :param max_body_lines: bodies of functions longer than it are capped on level CAP_BODIES
+        :param head_lines: count of first lines of capped body to keep
+        :param tail_lines: count of last lines of capped body to keep
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level of compaction: {level}")
+        self.level = level
+        self._max_literal = max_literal
+        self._max_body_lines = max(max_body_lines, head_lines + tail_lines + 1)
+        self._head_lines = head_lines
+        self._tail_lines = tail_lines
+        self._lock = threading.Lock()
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def compact(self, code: str) -> str:
+        """
+        Compact code of object
+        :param code: source code of object
+        :return: compacted code
+        """
+        result = code
+        if self.level >= STRIP:
+            try:
+                result = self._strip(textwrap.dedent(code))
+                if self.level >= CAP_BODIES:
+                    result = self._cap_bodies(result)
+            except (tokenize.TokenError, SyntaxError):
+                result = code
+
+        with self._lock:
+            self.bytes_before += len(code.encode('utf-8'))
+            self.bytes_after += len(result.encode('utf-8'))
+        return result
+
+    def _strip(self, code: str) -> str:
+        """Remove comments (and long literals on level ELIDE_LITERALS), then blank lines and trailing whitespace"""
+        lines = io.StringIO(code).readlines()
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+
+        replacements: list[tuple[int, int, str]] = []
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            start = offsets[token.start[0] - 1] + token.start[1]
+            end = offsets[token.end[0] - 1] + token.end[1]
+            if token.type == tokenize.COMMENT:
+                replacements.append((start, end, ''))
+            elif self.level >= ELIDE_LITERALS and token.type == tokenize.STRING and end - start > self._max_literal:
+                replacements.append((start, end, self._elided_literal(token.string)))
+
+        parts: list[str] = []
+        position = 0
+        for start, end, text in replacements:
+            parts += [code[position:start], text]
+            position = end
+        parts.append(code[position:])
+
+        stripped = (line.rstrip() for line in ''.join(parts).splitlines())
+        return ''.join(f"{line}\n" for line in stripped if line)
+
+    @staticmethod
+    def _elided_literal(literal: str) -> str:
+        match = STRING_PREFIX_PATTERN.match(literal)
+        if match is None:
+            return literal
+        prefix, quote = match.groups()
+        return f"{prefix}{quote}...{quote}"
+
+    def _cap_bodies(self, code: str) -> str:
+        """Keep head and tail of bodies of long functions without nested functions and classes"""
+        tree = ast.parse(code)
+        lines = code.splitlines(keepends=True)
+        ranges: list[tuple[int, int, int]] = []
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) or node.end_lineno is None:
+                continue
+            # Nested objects are documented too, so their code is never elided
+            if any(isinstance(child, DEFINITIONS) for statement in node.body for child in ast.walk(statement)):
+                continue
+            first, last = node.body[0].lineno - 1, node.end_lineno
+            if last - first <= self._max_body_lines:
+                continue
+            # Only whole statements of body are elided
+            starts = [statement.lineno - 1 for statement in node.body]
+            start = next((line for line in starts if line >= first + self._head_lines), last)
+            end = next((line for line in starts if line >= last - self._tail_lines), last)
+            if start < end:
+                ranges.append((start, end, node.body[0].col_offset))
+
+        for start, end, indent in sorted(ranges, reverse=True):
+            lines[start:end] = [f"{' ' * indent}...  # {end - start} lines elided\n"]
+        return ''.join(lines)
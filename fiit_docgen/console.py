@@ -2,11 +2,32 @@
 import os
 import sys
 from pathlib import Path
+from typing import Callable
 
-from fiit_docgen.ai_requester import AIRequester
+from fiit_docgen.backends import BACKENDS, Backend, HedgedBackend
+from fiit_docgen.batcher import DEFAULT_BATCH_TOKENS
+from fiit_docgen.cache import DEFAULT_CACHE_DIR, DocCache
 from fiit_docgen.code_changer import CodeChanger
-from fiit_docgen.parser import Parser
-from fiit_docgen.records import PosWithBody, PosWithDoc
+from fiit_docgen.compaction import LEVELS, STRIP, Compactor
+from fiit_docgen.journal import Journal, ProgressiveWriter
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.parser import PARSERS
+from fiit_docgen.project import (
+    DEFAULT_EXCLUDE,
+    DEFAULT_INCLUDE,
+    MIN_FILES_FOR_POOL,
+    find_python_files,
+    parse_files,
+)
+from fiit_docgen.records import DocumentationNotReceived, FileResult, PosWithBody, PosWithDoc
+from fiit_docgen.scheduler import DEFAULT_CONCURRENCY, RateLimiter
+from fiit_docgen.transport import (
+    HttpTransport,
+    MeteredTransport,
+    RecordingTransport,
+    ReplayTransport,
+    Transport,
+)
 
 
 class DocGen:
@@ -16,35 +37,230 @@ class DocGen:
         self.parser = argparse.ArgumentParser(description='DocGen - automatically generate documentation for your code')
         self._setup_arguments()
         self._code_path: Path | None = None
+        self._paths: list[Path] = []
+        self._check: bool = False
         self._api_key: str | None = None
+        self._provider: str = 'gemini'
+        self._url: str = BACKENDS['gemini'].DEFAULT_URL
+        self._model: str = BACKENDS['gemini'].DEFAULT_MODEL
+        self._hedge: str | None = None
+        self._hedge_url: str = ''
+        self._hedge_model: str = ''
+        self._hedge_api_key: str = ''
+        self._hedge_after: float | None = None
         self._regen: bool = False
+        self._backend: str = 'ast'
+        self._since: str | None = None
+        self._watch: bool = False
+        self._include: list[str] = list(DEFAULT_INCLUDE)
+        self._exclude: list[str] = list(DEFAULT_EXCLUDE)
+        self._jobs: int | None = None
+        self._cache_dir: Path | None = DEFAULT_CACHE_DIR
+        self._resume: bool = False
+        self._batch_tokens: int = DEFAULT_BATCH_TOKENS
+        self._concurrency: int = DEFAULT_CONCURRENCY
+        self._requests_per_minute: float | None = None
+        self._tokens_per_minute: float | None = None
+        self._stream: bool = False
+        self._json_output: bool = False
+        self._compact: int = STRIP
+        self._record: Path | None = None
+        self._replay: Path | None = None
+        self._profile: Path | None = None
+        self._metrics_textfile: Path | None = None
+        self._metrics = Metrics()
 
     def _setup_arguments(self) -> None:
-        self.parser.add_argument('path', type=Path, help='Path to the code file')
-        self.parser.add_argument('--api-key', '-a', type=str, help='Gemini API key')
+        self.parser.add_argument(
+            'path', type=Path, nargs='+', help='Path to the code file or project directory (several with --check)'
+        )
+        self.parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report undocumented objects and exit with code 1 if there are any, '
+            'without AI and network (for pre-commit hooks)',
+        )
+        self.parser.add_argument('--api-key', '-a', type=str, help='API key of AI (Gemini API key by default)')
+        self.parser.add_argument(
+            '--provider',
+            choices=sorted(BACKENDS),
+            default='gemini',
+            help='API of AI: gemini or openai (OpenAI-compatible chat completions, e.g. local server) '
+            '(default: gemini)',
+        )
+        self.parser.add_argument('--url', help='Base URL of API of AI (default: URL of provider)')
+        self.parser.add_argument('--model', help='Model of AI (default: model of provider)')
         self.parser.add_argument('-r', '--regen', action='store_true', help='Regenerate existing documentation')
+        self.parser.add_argument(
+            '--backend',
+            choices=sorted(PARSERS),
+            default='ast',
+            help='Parser of code: ast (exact, falls back to regex on syntax errors) or regex (default: ast)',
+        )
+        self.parser.add_argument(
+            '--since', metavar='GIT_REF', help='Document only objects changed since git ref (e.g. origin/main)'
+        )
+        self.parser.add_argument(
+            '--watch', '-w', action='store_true', help='Watch files and document new or changed objects until Ctrl+C'
+        )
+        self.parser.add_argument(
+            '--include', action='append', metavar='GLOB', help='Glob of files to document in directory (default: *.py)'
+        )
+        self.parser.add_argument(
+            '--exclude', action='append', metavar='GLOB', help='Glob of files or directories to skip in directory'
+        )
+        self.parser.add_argument(
+            '--jobs',
+            '-j',
+            type=int,
+            help='Number of processes to parse directory and threads to write files (default: number of CPUs)',
+        )
+        self.parser.add_argument(
+            '--cache-dir', type=Path, default=DEFAULT_CACHE_DIR, help='Documentation cache directory (default: .docgen)'
+        )
+        self.parser.add_argument('--no-cache', action='store_true', help='Do not use documentation cache')
+        self.parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue interrupted run: documentation received by it is not requested again (see --cache-dir). '
+            'Runs with --no-cache are not journaled',
+        )
+        self.parser.add_argument(
+            '--batch-tokens',
+            type=int,
+            default=DEFAULT_BATCH_TOKENS,
+            help=f'Budget of code tokens in one request to AI (default: {DEFAULT_BATCH_TOKENS})',
+        )
+        self.parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help=f'Maximal count of requests to AI in flight (default: {DEFAULT_CONCURRENCY})',
+        )
+        self.parser.add_argument('--rpm', type=float, help='Quota of requests to AI per minute (default: unlimited)')
+        self.parser.add_argument('--tpm', type=float, help='Quota of tokens sent to AI per minute (default: unlimited)')
+        self.parser.add_argument(
+            '--compact',
+            type=int,
+            choices=LEVELS,
+            default=STRIP,
+            help='Compaction of code sent to AI: 0 - none, 1 - strip comments and blank lines, '
+            '2 - also elide long string literals, 3 - also cap long function bodies (default: 1)',
+        )
+        self.parser.add_argument(
+            '--stream', action='store_true', help='Receive answers of AI as stream and parse them as they arrive'
+        )
+        self.parser.add_argument(
+            '--hedge',
+            choices=sorted(BACKENDS),
+            metavar='PROVIDER',
+            help='Send slow requests again to second AI and take the first answer',
+        )
+        self.parser.add_argument('--hedge-url', help='Base URL of second AI (default: URL of its provider)')
+        self.parser.add_argument('--hedge-model', help='Model of second AI (default: model of its provider)')
+        self.parser.add_argument('--hedge-api-key', help='API key of second AI')
+        self.parser.add_argument(
+            '--hedge-after',
+            type=float,
+            metavar='SECONDS',
+            help='Wait for the first AI so long until p95 of its latency is known (default: do not hedge until then)',
+        )
+        self.parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Ask AI to answer in JSON by schema of documentation instead of lines of text (structured output)',
+        )
+        cassette = self.parser.add_mutually_exclusive_group()
+        cassette.add_argument('--record', type=Path, metavar='CASSETTE', help='Save requests and answers of AI to file')
+        cassette.add_argument(
+            '--replay',
+            type=Path,
+            metavar='CASSETTE',
+            help='Answer requests from file saved by --record without network',
+        )
+        self.parser.add_argument(
+            '--profile', type=Path, metavar='JSON', help='Save time of stages, counts of requests, tokens and files'
+        )
+        self.parser.add_argument(
+            '--metrics-textfile', type=Path, metavar='PROM', help='Save the same metrics for Prometheus node_exporter'
+        )
 
     def _parse_arguments(self) -> None:
         args = self.parser.parse_args()
-        self._code_path = args.path
-        self._api_key = args.api_key or os.getenv('GEMINI_API_KEY')
+        self._paths = args.path
+        self._code_path = args.path[0]
+        self._check = args.check
+        if len(self._paths) > 1 and not self._check:
+            self.parser.error('several paths are supported only with --check')
+        if args.resume and args.no_cache:
+            self.parser.error('--resume reads journal from cache directory and cannot be used with --no-cache')
+        self._provider = args.provider
+        backend = BACKENDS[self._provider]
+        self._api_key = args.api_key or os.getenv(backend.API_KEY_ENV)
+        self._url = args.url or backend.DEFAULT_URL
+        self._model = args.model or backend.DEFAULT_MODEL
+        self._hedge = args.hedge
+        if self._hedge is not None:
+            hedge = BACKENDS[self._hedge]
+            self._hedge_url = args.hedge_url or hedge.DEFAULT_URL
+            self._hedge_model = args.hedge_model or hedge.DEFAULT_MODEL
+            self._hedge_api_key = args.hedge_api_key or os.getenv(hedge.API_KEY_ENV) or ''
+        self._hedge_after = args.hedge_after
         self._regen = args.regen
+        self._backend = args.backend
+        self._since = args.since
+        self._watch = args.watch
+        self._include = args.include or list(DEFAULT_INCLUDE)
+        self._exclude = list(DEFAULT_EXCLUDE) + (args.exclude or [])
+        self._jobs = args.jobs
+        self._cache_dir = None if args.no_cache else args.cache_dir
+        self._resume = args.resume
+        self._batch_tokens = args.batch_tokens
+        self._concurrency = args.concurrency
+        self._requests_per_minute = args.rpm
+        self._tokens_per_minute = args.tpm
+        self._stream = args.stream
+        self._json_output = args.json
+        self._compact = args.compact
+        self._record = args.record
+        self._replay = args.replay
+        self._profile = args.profile
+        self._metrics_textfile = args.metrics_textfile
 
     def _validate_paths(self) -> bool:
-        if not self._check_path(self._code_path):
-            return False
-        return True
+        return all(self._check_path(path) for path in self._paths)
 
     def _validate_api_key(self) -> bool:
+        if self._replay is not None or not BACKENDS[self._provider].REQUIRES_API_KEY:
+            return True
         return self._api_key is not None and len(self._api_key) > 0
 
     @staticmethod
     def _check_path(path: Path | None) -> bool:
-        return path is not None and path.exists() and path.is_file()
+        return path is not None and path.exists() and (path.is_file() or path.is_dir())
 
     def _run_parser(self) -> dict[str, PosWithBody]:
+        with self._metrics.stage('parse'):
+            result = self._find_objects()
+        self._metrics.add('objects_to_document', len(result))
+        return result
+
+    def _find_objects(self) -> dict[str, PosWithBody]:
+        from fiit_docgen.git_diff import changed_lines, filter_changed
+
+        changes = changed_lines(self._since, self._code_path) if self._since and self._code_path else None
+        result = self._run_file_parser(changes)
+        if changes is not None:
+            result = filter_changed(result, changes)
+            print(f'{len(result)} of them changed since {self._since}')
+        return result
+
+    def _run_file_parser(self, changes: dict[str, list[tuple[int, int]]] | None) -> dict[str, PosWithBody]:
+        if self._code_path is not None and self._code_path.is_dir():
+            return self._run_project_parser(self._code_path, changes)
         print(f'Parsing file: {self._code_path}')
-        parser = Parser(str(self._code_path))
+        parser = PARSERS[self._backend](str(self._code_path))
+        self._metrics.add('objects_parsed', parser.objects_length)
         if self._regen:
             result = parser.parse_generated_from_file(str(self._code_path))
             print(f'Found {len(result)} items of {parser.objects_length} with generated documentation to regenerate')
@@ -53,35 +269,213 @@ class DocGen:
             print(f'Found {len(result)} items of {parser.objects_length} to document')
         return result
 
-    def _generate_documentation(self, parsed_data: dict[str, PosWithBody]) -> dict[str, PosWithDoc]:
+    def _run_project_parser(
+        self, root: Path, changes: dict[str, list[tuple[int, int]]] | None
+    ) -> dict[str, PosWithBody]:
+        files = find_python_files(root, self._include, self._exclude)
+        if changes is not None:
+            files = [file for file in files if os.path.realpath(file) in changes]
+        print(f'Parsing {len(files)} files in directory: {root}')
+        objects, objects_length = parse_files(files, self._regen, self._jobs, self._backend)
+        self._metrics.add('files_parsed', len(files))
+        self._metrics.add('objects_parsed', objects_length)
+        if self._regen:
+            print(f'Found {len(objects)} items of {objects_length} with generated documentation to regenerate')
+        else:
+            print(f'Found {len(objects)} items of {objects_length} to document')
+        return objects
+
+    def _make_transport(self) -> Transport:
+        if self._replay is not None:
+            return ReplayTransport(self._replay)
+        transport = HttpTransport(self._url, self._concurrency)
+        if self._record is not None:
+            return RecordingTransport(transport, self._record)
+        return transport
+
+    def _make_backend(self) -> Backend:
+        # Both AIs share transport, so they are recorded to the same cassette
+        transport = MeteredTransport(self._make_transport(), self._metrics)
+        backend = BACKENDS[self._provider](self._url, self._model, self._api_key or "", transport)
+        if self._hedge is None:
+            return backend
+        hedge = BACKENDS[self._hedge](self._hedge_url, self._hedge_model, self._hedge_api_key, transport)
+        return HedgedBackend(
+            backend,
+            hedge,
+            initial_deadline=self._hedge_after,
+            max_workers=2 * self._concurrency,
+            metrics=self._metrics,
+        )
+
+    def _generate_documentation(
+        self,
+        parsed_data: dict[str, PosWithBody],
+        on_docs: Callable[[dict[str, PosWithDoc]], None] | None = None,
+    ) -> dict[str, PosWithDoc]:
+        # asyncio is imported only when AI is called, so --check starts faster
+        from fiit_docgen.ai_requester import AsyncAIRequester
+
         print('Generating documentation with AI...')
-        result = AIRequester(parsed_data, apikey=self._api_key or "").get_docs()
+        backend = self._make_backend()
+        compactor = Compactor(self._compact)
+        # Regenerated documentation must not be taken from cache, but it replaces cached one
+        cache = DocCache(self._cache_dir, refresh=self._regen) if self._cache_dir is not None else None
+        try:
+            requester = AsyncAIRequester(
+                parsed_data,
+                model=self._model,
+                cache=cache,
+                max_batch_tokens=self._batch_tokens,
+                concurrency=self._concurrency,
+                rate_limiter=RateLimiter(self._requests_per_minute, self._tokens_per_minute),
+                backend=backend,
+                stream=self._stream,
+                json_output=self._json_output,
+                metrics=self._metrics,
+                compactor=compactor,
+            )
+            if requester.cached_length:
+                print(f'Found {requester.cached_length} items in cache')
+            if requester.duplicates_length:
+                print(f'Found {requester.duplicates_length} items with the same code, they are documented once')
+            if compactor.bytes_saved:
+                saved = compactor.bytes_saved / max(compactor.bytes_before, 1)
+                print(f'Compaction of code saved {compactor.bytes_saved} bytes ({saved:.0%})')
+            if requester.batches_length > 1:
+                print(f'Sending {requester.batches_length} requests to AI')
+            result = requester.get_docs(on_docs)
+        finally:
+            backend.close()
+            if cache is not None:
+                cache.close()
         print(f'Generated documentation for {len(result)} items')
         return result
 
-    def _apply_changes(self, ai_data: dict[str, PosWithDoc]) -> None:
-        print('Applying changes to code...')
-        CodeChanger(regen=self._regen).process_files(ai_data)
+    def _write_files(self, ai_data: dict[str, PosWithDoc]) -> list[FileResult]:
+        with self._metrics.stage('apply'):
+            results = CodeChanger(regen=self._regen, jobs=self._jobs).process_files(ai_data)
+        for result in results:
+            print(CodeChanger.describe(result))
+        return results
+
+    def _document(self, parsed_data: dict[str, PosWithBody]) -> None:
+        # Documentation is journaled and written to file as soon as it is received, so it is not lost on interruption.
+        # With --no-cache nothing is written to cache directory, so the run is not journaled
+        journal = Journal(self._cache_dir) if self._cache_dir is not None else None
+        resumed = journal.resume(parsed_data) if journal is not None and self._resume else {}
+        if journal is not None and not self._resume:
+            journal.clear()
+        if resumed:
+            print(f'Resumed {len(resumed)} items documented by interrupted run')
+            self._metrics.add('objects_resumed', len(resumed))
+
+        writer = ProgressiveWriter(parsed_data, self._write_files)
+        writer.add(resumed)
+        pending = {key: value for key, value in parsed_data.items() if key not in resumed}
+        documented = len(resumed)
+
+        def on_docs(docs: dict[str, PosWithDoc]) -> None:
+            if journal is not None:
+                journal.append(docs, parsed_data)
+            writer.add(docs)
+
+        try:
+            if pending:
+                with self._metrics.stage('generate'):
+                    documented += len(self._generate_documentation(pending, on_docs))
+            writer.finish()
+        finally:
+            if journal is not None:
+                journal.close()
+            self._metrics.add('objects_documented', documented)
+            self._metrics.add('files_written', writer.files_written)
+        if journal is not None:
+            journal.clear()
         print('Documentation successfully applied!')
 
+    def _run_watcher(self) -> None:
+        if self._code_path is None:
+            return
+        print(f'Watching {self._code_path}. Press Ctrl+C to stop')
+        from fiit_docgen.watcher import Watcher
+
+        watcher = Watcher(self._code_path, self._include, self._exclude, self._backend, self._regen)
+        watcher.run(self._on_changes)
+
+    def _on_changes(self, parsed_data: dict[str, PosWithBody]) -> None:
+        print(f'Found {len(parsed_data)} new or changed items to document')
+        self._document(parsed_data)
+
     def run(self) -> None:
         try:
             self._parse_arguments()
             if not self._validate_paths():
                 print('Error: Invalid file paths')
                 sys.exit(1)
+            if self._check:
+                self._run_check()
+                return
             if not self._validate_api_key():
-                print('Error: Gemini API key is required. Use --api-key or set GEMINI_API_KEY environment variable.')
+                print(
+                    f'Error: API key is required. Use --api-key or set '
+                    f'{BACKENDS[self._provider].API_KEY_ENV} environment variable.'
+                )
                 sys.exit(1)
+            if self._watch:
+                self._run_watcher()
+                return
             parsed_data = self._run_parser()
             if len(parsed_data) == 0:
                 print('No objects to doc found')
                 sys.exit(0)
-            ai_data = self._generate_documentation(parsed_data)
-            self._apply_changes(ai_data)
+            self._document(parsed_data)
+        except KeyboardInterrupt:
+            print('Interrupted. Run again with --resume to continue')
+            sys.exit(130)
+        except DocumentationNotReceived as e:
+            print(e)
+            sys.exit(-1)
         except Exception as e:
             print(f'Error: {e}')
             sys.exit(1)
+        finally:
+            self._save_metrics()
+
+    def _run_check(self) -> None:
+        files = [
+            file
+            for path in self._paths
+            for file in (find_python_files(path, self._include, self._exclude) if path.is_dir() else [path])
+        ]
+        jobs = self._jobs or (None if len(files) > MIN_FILES_FOR_POOL else 1)
+        with self._metrics.stage('parse'):
+            objects, objects_length = parse_files(files, jobs=jobs, backend=self._backend)
+        self._metrics.add('files_parsed', len(files))
+        self._metrics.add('objects_parsed', objects_length)
+        self._metrics.add('objects_to_document', len(objects))
+
+        for key, value in objects.items():
+            file_path = value.source.path if value.source is not None else CodeChanger._file_of_key(key)
+            name = key[len(file_path) + 1 :]
+            print(f'{os.path.relpath(file_path)}:{value.position.start_line + 1}: {name} is not documented')
+        if objects:
+            print(f'Found {len(objects)} items of {objects_length} without documentation')
+            sys.exit(1)
+        print(f'All {objects_length} items are documented')
+
+    def _save_metrics(self) -> None:
+        try:
+            if self._profile is not None:
+                self._metrics.write_json(self._profile)
+                stages = ', '.join(
+                    f'{name} {seconds:.2f}s' for name, seconds in self._metrics.to_dict()['stages'].items()
+                )
+                print(f'Profile saved to {self._profile}: {stages}')
+            if self._metrics_textfile is not None:
+                self._metrics.write_prometheus(self._metrics_textfile)
+        except OSError as e:
+            print(f'Cannot save metrics: {e}')
 
 
 def main() -> None:
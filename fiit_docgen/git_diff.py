@@ -0,0 +1,158 @@
+import bisect
+import os
+import re
+import subprocess
+from pathlib import Path
+
+from fiit_docgen.code_changer import CodeChanger
+from fiit_docgen.records import PosWithBody
+
+HUNK_PATTERN = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+# Файл целиком (новый, еще не добавленный в git)
+WHOLE_FILE = [(0, 2**63)]
+# Префиксы путей задаются явно, чтобы не зависеть от diff.noprefix и diff.mnemonicPrefix пользователя
+SRC_PREFIX = 'a/'
+DST_PREFIX = 'b/'
+# Экранирование в путях, которые git берет в кавычки (имена с кавычками, обратной косой чертой, переводами строк)
+QUOTED_ESCAPE_PATTERN = re.compile(rb'\\([0-7]{3}|.)')
+ESCAPES = {b'a': b'\a', b'b': b'\b', b't': b'\t', b'n': b'\n', b'v': b'\v', b'f': b'\f', b'r': b'\r'}
+
+
+class GitError(Exception):
+    """Ошибка вызова git"""
+
+
+def _git(args: list[str], cwd: Path) -> str:
+    """Запускает git и возвращает его вывод"""
+    try:
+        result = subprocess.run(
+            ['git', '-c', 'core.quotepath=off', *args], cwd=cwd, capture_output=True, text=True, encoding='utf-8'
+        )
+    except FileNotFoundError as e:
+        raise GitError('git is not installed') from e
+    if result.returncode != 0:
+        raise GitError(result.stderr.strip() or f'git {args[0]} failed')
+    return result.stdout
+
+
+def _unquote(name: str) -> str:
+    """
+    Путь из заголовка +++ в виде, в котором он записан на диске. Git добавляет табуляцию после имени с пробелом
+    и берет в кавычки с экранированием в стиле C имена со специальными символами
+    """
+    name = name.removesuffix('\t')
+    if len(name) < 2 or not name.startswith('"') or not name.endswith('"'):
+        return name
+
+    def unescape(match: re.Match[bytes]) -> bytes:
+        escape = match.group(1)
+        if len(escape) == 3:
+            return bytes([int(escape, 8)])
+        return ESCAPES.get(escape, escape)
+
+    return QUOTED_ESCAPE_PATTERN.sub(unescape, name[1:-1].encode('utf-8')).decode('utf-8', 'surrogateescape')
+
+
+def _parse_diff(diff: str, top_level: str) -> dict[str, list[tuple[int, int]]]:
+    """
+    Разбирает вывод git diff -U0
+    :return: словарь, где ключ - путь к файлу, значение - измененные диапазоны строк [start, end) (с нуля)
+    """
+    changes: dict[str, list[tuple[int, int]]] = {}
+    current: list[tuple[int, int]] | None = None
+
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            name = _unquote(line[4:])
+            current = None
+            if name.startswith(DST_PREFIX):
+                path = os.path.join(top_level, name[len(DST_PREFIX) :])
+                current = changes.setdefault(os.path.realpath(path), [])
+            continue
+        match = HUNK_PATTERN.match(line)
+        if match and current is not None:
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count == 0:
+                # Только удаленные строки: затронута строка перед удалением
+                current.append((max(start - 1, 0), max(start, 1)))
+            else:
+                current.append((start - 1, start - 1 + count))
+
+    return {file_path: _merge(ranges) for file_path, ranges in changes.items()}
+
+
+def _merge(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Сортирует диапазоны и объединяет пересекающиеся"""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def changed_lines(ref: str, path: Path) -> dict[str, list[tuple[int, int]]]:
+    """
+    Находит строки, измененные относительно ref (включая незакоммиченные изменения и новые файлы)
+    :param ref: git-ссылка (ветка, тег, коммит)
+    :param path: файл или директория внутри репозитория
+    :return: словарь, где ключ - реальный путь к файлу, значение - отсортированные диапазоны строк [start, end)
+    """
+    cwd = path if path.is_dir() else path.parent
+    top_level = _git(['rev-parse', '--show-toplevel'], cwd).strip()
+    target = str(path.resolve())
+
+    diff = _git(
+        [
+            'diff',
+            '--no-color',
+            '--no-ext-diff',
+            '--unified=0',
+            f'--src-prefix={SRC_PREFIX}',
+            f'--dst-prefix={DST_PREFIX}',
+            ref,
+            '--',
+            target,
+        ],
+        cwd,
+    )
+    changes = _parse_diff(diff, top_level)
+
+    # С -z имена не берутся в кавычки
+    untracked = _git(['ls-files', '-z', '--others', '--exclude-standard', '--full-name', '--', target], cwd)
+    for name in filter(None, untracked.split('\0')):
+        changes[os.path.realpath(os.path.join(top_level, name))] = WHOLE_FILE
+
+    return changes
+
+
+def _intersects(ranges: list[tuple[int, int]], start: int, end: int) -> bool:
+    """Проверяет, пересекается ли [start, end) с одним из отсортированных непересекающихся диапазонов"""
+    # Последний диапазон, начинающийся до end, заканчивается позже всех предыдущих
+    i = bisect.bisect_left(ranges, (end, -1))
+    return i > 0 and ranges[i - 1][1] > start
+
+
+def filter_changed(
+    objects: dict[str, PosWithBody], changes: dict[str, list[tuple[int, int]]]
+) -> dict[str, PosWithBody]:
+    """
+    Оставляет только объекты, строки которых (с декораторами) пересекаются с изменениями
+    :param objects: объекты после парсинга
+    :param changes: результат changed_lines
+    :return: затронутые изменениями объекты
+    """
+    result: dict[str, PosWithBody] = {}
+    for key, value in objects.items():
+        file_path = value.source.path if value.source is not None else CodeChanger._file_of_key(key)
+        ranges = changes.get(os.path.realpath(file_path))
+        if not ranges:
+            continue
+        position = value.position
+        start = position.start_line - position.decorators
+        end = max(position.end_line, position.start_line + 1)
+        if _intersects(ranges, start, end):
+            result[key] = value
+    return result
@@ -0,0 +1,148 @@
+import json
+import threading
+from pathlib import Path
+from typing import Callable, TextIO
+
+from fiit_docgen.cache import DEFAULT_CACHE_DIR, fingerprint
+from fiit_docgen.code_changer import CodeChanger
+from fiit_docgen.records import FileResult, PosWithBody, PosWithDoc
+
+
+class Journal:
+    """
+    Append-only journal of documentation received from AI during run. Every line is one documented object
+    with fingerprint of its code, so after crash, Ctrl+C or exit on 429 the run can be resumed without
+    paying for the same documentation again. Objects, which code changed since, are not resumed
+    """
+
+    FILE_NAME = 'journal.jsonl'
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR):
+        """
+        Initialize Journal
+        :param directory: directory to store journal in
+        """
+        self.path = directory / self.FILE_NAME
+        self._lock = threading.Lock()
+        self._file: TextIO | None = None
+
+    def load(self) -> dict[str, tuple[str, str]]:
+        """
+        Read journal. Line cut by crash is skipped
+        :return: dict, where key is object, value is fingerprint of its code and its doc
+        """
+        if not self.path.exists():
+            return {}
+        entries: dict[str, tuple[str, str]] = {}
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[entry["key"]] = (entry["fingerprint"], entry["doc"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return entries
+
+    def resume(self, objects: dict[str, PosWithBody]) -> dict[str, PosWithDoc]:
+        """
+        Get documentation of objects recorded by previous run
+        :param objects: objects to doc
+        :return: dict, where key object to doc, value is doc with current position of object
+        """
+        entries = self.load()
+        result: dict[str, PosWithDoc] = {}
+        for key, value in objects.items():
+            if key in entries and entries[key][0] == fingerprint(value.text):
+                result[key] = PosWithDoc(value.position, entries[key][1], value.source)
+        return result
+
+    def append(self, docs: dict[str, PosWithDoc], objects: dict[str, PosWithBody]) -> None:
+        """
+        Record documentation, it is flushed to disk before method returns
+        :param docs: dict, where key object to doc, value is doc
+        :param objects: objects to doc, fingerprints are computed from their code
+        """
+        lines = [
+            json.dumps({"key": key, "fingerprint": fingerprint(objects[key].text), "doc": doc.Documentation})
+            for key, doc in docs.items()
+            if key in objects
+        ]
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(''.join(f"{line}\n" for line in lines))
+            self._file.flush()
+
+    def clear(self) -> None:
+        """
+        Remove journal, when run is finished
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ProgressiveWriter:
+    """
+    Writes documentation to file as soon as all objects of this file are documented,
+    so documentation already received is kept in code even if run is interrupted
+    """
+
+    def __init__(
+        self, objects: dict[str, PosWithBody], write: Callable[[dict[str, PosWithDoc]], list[FileResult]] | None = None
+    ):
+        """
+        Initialize ProgressiveWriter
+        :param objects: objects to doc
+        :param write: writes documentation to files and returns results of files (CodeChanger by default)
+        """
+        self._write = write or CodeChanger().process_files
+        self._remaining: dict[str, set[str]] = {}
+        self._files: dict[str, str] = {}
+        for key, value in objects.items():
+            file_path = value.source.path if value.source is not None else CodeChanger._file_of_key(key)
+            self._files[key] = file_path
+            self._remaining.setdefault(file_path, set()).add(key)
+        self._docs: dict[str, dict[str, PosWithDoc]] = {}
+        self.results: list[FileResult] = []
+
+    @property
+    def files_written(self) -> int:
+        return sum(result.written for result in self.results)
+
+    def add(self, docs: dict[str, PosWithDoc]) -> None:
+        """
+        Add documentation, files with all objects documented are written
+        :param docs: dict, where key object to doc, value is doc
+        """
+        for key, doc in docs.items():
+            file_path = self._files.get(key)
+            if file_path is None or file_path not in self._remaining:
+                continue
+            self._docs.setdefault(file_path, {})[key] = doc
+            self._remaining[file_path].discard(key)
+            if not self._remaining[file_path]:
+                self._flush(file_path)
+
+    def finish(self) -> None:
+        """
+        Write files, which objects are documented only partially
+        """
+        docs = {key: doc for file_path in list(self._docs) for key, doc in self._pop(file_path).items()}
+        if docs:
+            self.results += self._write(docs)
+
+    def _flush(self, file_path: str) -> None:
+        docs = self._pop(file_path)
+        if docs:
+            self.results += self._write(docs)
+
+    def _pop(self, file_path: str) -> dict[str, PosWithDoc]:
+        del self._remaining[file_path]
+        return self._docs.pop(file_path, {})
@@ -0,0 +1,141 @@
+import contextlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from fiit_docgen.source import atomic_write
+
+
+class _Timing:
+    """Count, sum and maximum of durations of one kind of operation"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """
+    Collects wall time of stages, counters and durations of operations (HTTP calls) of one run.
+    Shared by all threads of run, so all methods are thread-safe
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        """
+        Initialize Metrics
+        :param clock: monotonic clock
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stages: dict[str, float] = {}
+        self._counters: dict[str, float] = {}
+        self._timings: dict[str, _Timing] = {}
+        self._active = threading.local()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Measure wall time of stage, time of repeated stages is summed.
+        Time of stage nested in another one (apply while generating) is counted only in nested stage,
+        so stages do not overlap
+        :param name: name of stage
+        """
+        nested: list[float] = self._active.__dict__.setdefault('nested', [])
+        start = self._clock()
+        nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - start
+            inner = nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            with self._lock:
+                self._stages[name] = self._stages.get(name, 0.0) + elapsed - inner
+
+    def add(self, name: str, value: float = 1) -> None:
+        """
+        Increase counter
+        :param name: name of counter
+        :param value: increment
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Record duration of one operation
+        :param name: name of operation
+        :param seconds: duration in seconds
+        """
+        with self._lock:
+            self._timings.setdefault(name, _Timing()).observe(seconds)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Summary of run
+        :return: dict with stages (seconds), counters and timings (count, sum and max of seconds)
+        """
+        with self._lock:
+            return {
+                "stages": dict(self._stages),
+                "counters": dict(self._counters),
+                "timings": {
+                    name: {"count": timing.count, "sum": timing.sum, "max": timing.max}
+                    for name, timing in self._timings.items()
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "docgen") -> str:
+        """
+        Summary of run in Prometheus text format
+        :param prefix: prefix of names of metrics
+        :return: text of metrics
+        """
+        summary = self.to_dict()
+        lines = [f"# TYPE {prefix}_stage_seconds gauge"]
+        lines += [f'{prefix}_stage_seconds{{stage="{name}"}} {value}' for name, value in summary["stages"].items()]
+        for name, value in summary["counters"].items():
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        for name, timing in summary["timings"].items():
+            metric = f"{prefix}_{_metric_name(name)}_seconds"
+            lines += [
+                f"# TYPE {metric} summary",
+                f"{metric}_count {timing['count']}",
+                f"{metric}_sum {timing['sum']}",
+                f"# TYPE {metric}_max gauge",
+                f"{metric}_max {timing['max']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: Path) -> None:
+        """
+        Save summary of run to json file
+        :param path: path to file
+        """
+        atomic_write(path, json.dumps(self.to_dict(), indent=2).encode('utf-8'))
+
+    def write_prometheus(self, path: Path) -> None:
+        """
+        Save summary of run to textfile of node_exporter. File is replaced atomically to not be read half-written
+        :param path: path to file, should end with .prom
+        """
+        atomic_write(path, self.to_prometheus().encode('utf-8'))
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
@@ -1,8 +1,9 @@
-import os.path
+import ast
 import re
 
-from fiit_docgen.code_changer import CodeChanger
-from fiit_docgen.records import ClassOrFunc, Position, PosWithBody
+from fiit_docgen.code_changer import CodeChanger, DefinitionIndex
+from fiit_docgen.records import ClassOrFunc, Position, PosWithBody, Span
+from fiit_docgen.source import SourceFile
 
 
 class Parser:
@@ -21,6 +22,8 @@ class Parser:
         self._stack: list[ClassOrFunc] = []
         self._path_to_current_file = path_to_file
         self._file: list[str] = []
+        self._source: SourceFile | None = None
+        self._index = DefinitionIndex(self._file)
         self._dictionary: dict[str, PosWithBody] = {}
 
         self._dictionary = self._parse_all_from_file(self._path_to_current_file)
@@ -29,19 +32,28 @@ class Parser:
     def objects_length(self) -> int:
         return len(self._dictionary)
 
+    @property
+    def source(self) -> SourceFile | None:
+        return self._source
+
     def _parse_all_from_file(self, filename: str) -> dict[str, PosWithBody]:
         """Основная функция - считывает файл"""
-        with open(filename, 'r', encoding='utf-8-sig') as f:
-            self._path_to_current_file = os.path.realpath(filename)
-            self._file = f.readlines()
-        return self._parse(self._file)
+        self._source = SourceFile.read(filename)
+        self._path_to_current_file = self._source.path
+        self._file = self._source.lines
+        self._index = DefinitionIndex(self._file)
+        self._parse(self._file)
+        # Все объекты ссылаются на один прочитанный файл, CodeChanger не читает его повторно
+        for pos_with_body in self._dictionary.values():
+            pos_with_body.source = self._source
+        return self._dictionary
 
     def parse_from_file(self, filename: str) -> dict[str, PosWithBody]:
         if len(self._dictionary) == 0:
             self._parse_all_from_file(filename)
         result = {}
         for path, pos_with_body in self._dictionary.items():
-            if not CodeChanger.has_existing_docstring(self._file, pos_with_body.position):
+            if not CodeChanger.has_existing_docstring(self._file, pos_with_body.position, self._index):
                 result[path] = pos_with_body
         return result
 
@@ -51,7 +63,7 @@ class Parser:
             self._parse_all_from_file(filename)
         result = {}
         for path, pos_with_body in self._dictionary.items():
-            if CodeChanger.is_generated_docstring(self._file, pos_with_body.position):
+            if CodeChanger.is_generated_docstring(self._file, pos_with_body.position, self._index):
                 result[path] = pos_with_body
         return result
 
@@ -62,7 +74,7 @@ class Parser:
         for i, line in enumerate(lines):
             stripped = line.lstrip()
             offset = len(line) - len(stripped)
-            if offset == 1:  # пустая строка
+            if not stripped:  # пустая строка (в том числе с \r\n или пробелами)
                 continue
             if offset <= last_offset and not stripped.startswith(
                 ')'
@@ -84,11 +96,12 @@ class Parser:
         for prev in reversed(self._stack):
             if prev.pos < offset or self._dictionary[prev.path].position.end_line > 0:
                 continue
-            self._dictionary[prev.path].position.end_line = line_num - 1
-            self._dictionary[prev.path].body = CodeChanger.remove_docstring(
-                lines, self._dictionary[prev.path].position, False
-            )
-            self._dictionary[prev.path].position.start_line += self._dictionary[prev.path].position.decorators
+            position = self._dictionary[prev.path].position
+            position.end_line = line_num - 1
+            # Docstring ищется после строки def, а не после декораторов
+            position.start_line += position.decorators
+            self._dictionary[prev.path].lines = lines
+            self._dictionary[prev.path].spans = CodeChanger.body_spans(lines, position, self._index)
 
     def _check_match(
         self, pattern: re.Pattern[str], line: str, line_num: int, decorator_counter: int, offset: int
@@ -116,3 +129,85 @@ class Parser:
         self._dictionary[class_or_func.path] = PosWithBody(
             Position(line_num - decorator_counter, pos, decorators=decorator_counter)
         )
+
+
+class AstParser(Parser):
+    """
+    Парсер на основе ast. За один проход находит для каждого объекта начало, конец заголовка,
+    docstring и конец тела. Если файл не удается разобрать (SyntaxError), используется базовый парсер
+    """
+
+    def _parse(self, lines: list[str]) -> dict[str, PosWithBody]:
+        """Ищет функции и классы в списке строк"""
+        try:
+            tree = ast.parse(''.join(lines))
+        except (SyntaxError, ValueError):
+            return super()._parse(lines)
+
+        self._visit(tree, self._path_to_current_file, lines)
+        return self._dictionary
+
+    def _visit(self, node: ast.AST, path: str, lines: list[str]) -> None:
+        """Обходит дерево, добавляя в словарь функции и классы в порядке их появления в файле"""
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                child_path = f"{path}/{child.name}"
+                self._dictionary[child_path] = self._make_pos_with_body(child, lines)
+                self._visit(child, child_path, lines)
+            elif isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                # Определения бывают только среди инструкций, выражения и аргументы не обходятся
+                self._visit(child, path, lines)
+
+    @staticmethod
+    def _find_header_end(lines: list[str], start_line: int, body_line: int) -> int:
+        """
+        Ищет строку двоеточия, закрывающего заголовок. Между ним и первой строкой тела
+        могут быть только пустые строки и комментарии, поэтому файл не токенизируется
+        """
+        for i in range(body_line - 1, start_line, -1):
+            stripped = lines[i].lstrip()
+            if stripped and not stripped.startswith('#'):
+                return i
+        return start_line
+
+    @staticmethod
+    def _make_pos_with_body(
+        node: ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef, lines: list[str]
+    ) -> PosWithBody:
+        """Формирует позицию и тело (без docstring) объекта"""
+        start_line = node.lineno - 1
+        first_line = node.decorator_list[0].lineno - 1 if node.decorator_list else start_line
+        end_line = node.end_lineno if node.end_lineno is not None else len(lines)
+
+        first = node.body[0]
+        decorators = getattr(first, 'decorator_list', None)
+        body_line = (decorators[0] if decorators else first).lineno - 1
+        if lines[body_line][: first.col_offset].strip():
+            # Тело начинается в строке заголовка (def f(): return 1), отступа тела нет
+            header_end, body_indent = body_line, ''
+        else:
+            # Отступ копируется из строки тела как есть, чтобы не смешивать табуляции и пробелы
+            header_end = AstParser._find_header_end(lines, start_line, body_line)
+            body_indent = lines[body_line][: first.col_offset]
+
+        position = Position(
+            start_line,
+            node.col_offset,
+            end_line,
+            decorators=start_line - first_line,
+            header_end=header_end,
+            body_indent=body_indent,
+        )
+        spans: tuple[Span, ...] = ((first_line, end_line),)
+
+        if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+            position.doc_start = first.lineno - 1
+            position.doc_end = (first.end_lineno or first.lineno) - 1
+            if position.doc_start > header_end:
+                spans = ((first_line, position.doc_start), (position.doc_end + 1, end_line))
+
+        # Все объекты ссылаются на строки файла, тело собирается только при запросе к AI
+        return PosWithBody(position, lines=lines, spans=spans)
+
+
+PARSERS: dict[str, type[Parser]] = {'regex': Parser, 'ast': AstParser}
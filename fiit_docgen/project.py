@@ -0,0 +1,85 @@
+import fnmatch
+import os
+from pathlib import Path
+from typing import Sequence
+
+from fiit_docgen.parser import PARSERS
+from fiit_docgen.records import ParseResult, PosWithBody
+
+DEFAULT_INCLUDE = ('*.py',)
+DEFAULT_EXCLUDE = ('.git', '.hg', '.venv', 'venv', '__pycache__', '.docgen', '.tox', 'build', 'dist')
+# Для меньшего количества файлов запуск пула процессов дольше самого парсинга
+MIN_FILES_FOR_POOL = 16
+
+
+def _matches(rel_path: str, patterns: Sequence[str]) -> bool:
+    """Проверяет, подходит ли относительный путь (или его имя) под один из glob-шаблонов"""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def find_python_files(
+    root: Path, include: Sequence[str] = DEFAULT_INCLUDE, exclude: Sequence[str] = DEFAULT_EXCLUDE
+) -> list[Path]:
+    """
+    Рекурсивно ищет файлы в директории root
+    :param root: корневая директория проекта
+    :param include: glob-шаблоны файлов, которые нужно документировать
+    :param exclude: glob-шаблоны файлов и директорий, которые нужно пропустить
+    :return: отсортированный список найденных файлов
+    """
+    found: list[Path] = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        rel_dir = Path(dir_path).relative_to(root).as_posix()
+        prefix = '' if rel_dir == '.' else f'{rel_dir}/'
+        dir_names[:] = sorted(name for name in dir_names if not _matches(f'{prefix}{name}', exclude))
+        for name in sorted(file_names):
+            rel_path = f'{prefix}{name}'
+            if _matches(rel_path, include) and not _matches(rel_path, exclude):
+                found.append(Path(dir_path) / name)
+    return found
+
+
+def _parse_file(path: str, regen: bool, backend: str) -> ParseResult:
+    """Парсит один файл. Вызывается в отдельном процессе"""
+    try:
+        parser = PARSERS[backend](path)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f'Cannot parse {path}: {e}')
+        return ParseResult({}, 0)
+    objects = parser.parse_generated_from_file(path) if regen else parser.parse_from_file(path)
+    return ParseResult(objects, parser.objects_length)
+
+
+def parse_files(
+    files: Sequence[Path], regen: bool = False, jobs: int | None = None, backend: str = 'ast'
+) -> ParseResult:
+    """
+    Парсит файлы в пуле процессов и объединяет результаты в один словарь
+    :param files: файлы для парсинга
+    :param regen: искать объекты со сгенерированной документацией вместо недокументированных
+    :param jobs: количество процессов, по умолчанию - количество ядер
+    :param backend: парсер из PARSERS
+    :return: объединенный словарь объектов и общее количество найденных объектов
+    """
+    paths = [str(file) for file in files]
+    workers = min(jobs or os.cpu_count() or 1, len(paths))
+
+    if workers <= 1:
+        results = [_parse_file(path, regen, backend) for path in paths]
+    else:
+        # Пул процессов импортирует multiprocessing, поэтому нужен только для нескольких файлов
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths) // (workers * 4))
+            results = list(
+                executor.map(_parse_file, paths, [regen] * len(paths), [backend] * len(paths), chunksize=chunksize)
+            )
+
+    objects: dict[str, PosWithBody] = {}
+    objects_length = 0
+    for result in results:
+        objects.update(result.objects)
+        objects_length += result.objects_length
+    return ParseResult(objects, objects_length)
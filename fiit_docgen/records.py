@@ -1,15 +1,31 @@
-﻿import sys
+﻿import json
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
-from typing import NamedTuple, TypedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, NamedTuple, TypedDict, TypeVar
 
+from fiit_docgen.batcher import DEFAULT_BATCH_TOKENS, Batcher, estimate_tokens
+from fiit_docgen.cache import DocCache, fingerprint
+from fiit_docgen.compaction import Compactor
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.scheduler import RateLimiter, RateLimitExceeded, backoff_delay
+from fiit_docgen.source import SourceFile
 
-@dataclass
+RequestBody = dict[str, Any]
+T = TypeVar('T')
+
+
+@dataclass(slots=True)
 class Position:
     start_line: int
     pos: int
     end_line: int = 0
     decorators: int = 0
+    # Filled by parser based on ast, -1 means unknown (doc_start is -1 also if there is no docstring)
+    header_end: int = -1
+    doc_start: int = -1
+    doc_end: int = -1
+    # Leading whitespace of first statement of body as in file (tabs are kept), empty if body starts on line of header
+    body_indent: str = ''
 
     def __repr__(self) -> str:
         return f"(lines:{self.start_line}-{self.end_line}, offset:{self.pos})"
@@ -18,6 +34,7 @@ class Position:
 class PosWithDoc(NamedTuple):
     Position: Position
     Documentation: str
+    Source: SourceFile | None = None
 
 
 class ClassOrFunc(NamedTuple):
@@ -25,10 +42,103 @@ class ClassOrFunc(NamedTuple):
     pos: int
 
 
-@dataclass
+Span = tuple[int, int]
+
+
 class PosWithBody:
-    position: Position
-    body: list[str] = field(default_factory=list)
+    """
+    Position of object and its code. Code is kept as spans (start, end) of lines of file, which are shared
+    by all objects of the file, so code of outer objects is not copied for every inner object.
+    Lines of code are joined only when they are needed (request to AI, key of cache)
+    """
+
+    __slots__ = ('position', 'source', 'lines', 'spans')
+
+    def __init__(
+        self,
+        position: Position,
+        body: list[str] | None = None,
+        source: SourceFile | None = None,
+        lines: list[str] | None = None,
+        spans: tuple[Span, ...] = (),
+    ):
+        """
+        Initialize PosWithBody
+        :param position: position of object
+        :param body: lines of code of object, if it is not given by spans
+        :param source: file of object
+        :param lines: lines of file, shared by objects of the file
+        :param spans: ranges of lines of code of object (without docstring)
+        """
+        self.position = position
+        self.source = source
+        self.lines: list[str] = []
+        self.spans: tuple[Span, ...] = ()
+        if lines is not None:
+            self.lines, self.spans = lines, spans
+        elif body is not None:
+            self.body = body
+
+    @property
+    def body(self) -> list[str]:
+        """Lines of code of object, a new list on every call"""
+        return [line for start, end in self.spans for line in self.lines[start:end]]
+
+    @body.setter
+    def body(self, body: list[str]) -> None:
+        self.lines, self.spans = body, ((0, len(body)),)
+
+    @property
+    def text(self) -> str:
+        """Code of object"""
+        return ''.join(self.body)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PosWithBody):
+            return NotImplemented
+        return (self.position, self.body, self.source) == (other.position, other.body, other.source)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"PosWithBody(position={self.position!r}, spans={self.spans!r})"
+
+
+class ParseResult(NamedTuple):
+    objects: dict[str, PosWithBody]
+    objects_length: int
+
+
+class Batch(NamedTuple):
+    outer_keys: list[str]
+    objects: dict[str, PosWithBody]
+    body: RequestBody
+
+
+class Definition(NamedTuple):
+    header_end: int
+    doc_start: int
+    doc_end: int
+    generated: bool
+    # Empty if body starts on line of header, docstring is not inserted then
+    body_indent: str = ''
+
+
+class Edit(NamedTuple):
+    start: int
+    end: int
+    lines: list[str]
+
+
+class FileResult(NamedTuple):
+    path: str
+    # One of statuses of CodeChanger
+    status: str
+    error: str = ""
+
+    @property
+    def written(self) -> bool:
+        return self.status == "written"
 
 
 class Element(TypedDict):
@@ -37,6 +147,15 @@ class Element(TypedDict):
     docstring: str
 
 
+class DocumentationNotReceived(Exception):
+    """
+    Raised by requester when AI did not document any object
+    """
+
+    def __init__(self) -> None:
+        super().__init__("Cannot get documentation. Please try again")
+
+
 class BaseAIRequester(ABC):
     """
     Base class for AIRequester. Inherit this class to create new requester to AI
@@ -61,71 +180,327 @@ class BaseAIRequester(ABC):
         "Каждое описание пиши на новой строке, не допускай пустых строк. Сам код писать не нужно, пиши "
         "только документацию и строго следуй инструкциям. Пиши документацию только на английском языке"
     )
+    # Increase on every change of SYS_INSTRUCTION to invalidate cached documentation
+    SYS_INSTRUCTION_VERSION = "1"
+    MAX_TRIES = 3
+    MAX_RATE_LIMIT_TRIES = 10
 
-    def __init__(self, objects_to_doc: dict[str, PosWithBody], url: str, model: str, apikey: str):
+    def __init__(
+        self,
+        objects_to_doc: dict[str, PosWithBody],
+        url: str,
+        model: str,
+        apikey: str,
+        cache: DocCache | None = None,
+        max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+        rate_limiter: RateLimiter | None = None,
+        metrics: Metrics | None = None,
+        compactor: Compactor | None = None,
+    ):
         """
         Initialize BaseAIRequester.
         :param objects_to_doc:
         :param url:
         :param model:
         :param apikey:
+        :param cache: documentation cache, objects found in it are not sent to AI
+        :param max_batch_tokens: budget of tokens of code in one request to AI
+        :param rate_limiter: client-side limiter of requests, shared by all requests of requester
+        :param metrics: metrics of run, collects cache hits, retries and 429 answers
+        :param compactor: compacts code before sending to AI, None - code is sent as is
         """
         self._url_to_ai = url
         self._api_key_to_ai = apikey
         self._model_of_ai = model
 
         self._objects_to_doc = objects_to_doc
-        self._body = {
-            "contents": [
-                {"role": "user", "parts": {"text": self.SYS_INSTRUCTION}},
-                {"role": "user", "parts": [{"text": body} for body in self._get_outer_objects_to_doc()]},
-            ]
+        self._outer_objects = self._group_outer_objects(list(self._objects_to_doc))
+        self._cache = cache
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._metrics = metrics or Metrics()
+        self._compactor = compactor
+        self._codes: dict[str, str] = {}
+        self._cached_docs: dict[str, PosWithDoc] = self._get_docs_from_cache()
+        self._metrics.add("cache_hits", len(self._cached_docs))
+        self._pending_objects = {
+            key: value for key, value in self._objects_to_doc.items() if key not in self._cached_docs
         }
+        # Copies of the same code are not sent, they get documentation of the first copy
+        self._copies = self._find_copies()
+        self._copied = {key for keys in self._copies.values() for key in keys}
+        self._metrics.add("duplicates", len(self._copied))
+        self._batches = [
+            self._make_batch([key for outer_key in outer_keys for key in self._outer_objects[outer_key]])
+            for outer_keys in Batcher(max_batch_tokens).split(self._get_outer_objects_to_doc())
+        ]
+
+    @property
+    def cached_length(self) -> int:
+        return len(self._cached_docs)
 
-    def _get_outer_objects_to_doc(self) -> list[str]:
+    @property
+    def batches_length(self) -> int:
+        return len(self._batches)
+
+    @property
+    def duplicates_length(self) -> int:
+        return len(self._copied)
+
+    @staticmethod
+    def _group_outer_objects(keys: list[str]) -> dict[str, list[str]]:
         """
-        get outer objects to doc to don't write double documentation
-        :return: list of objects to doc
+        Group objects to doc by outer objects, whose bodies contain inner objects
+        :param keys: objects to doc in order of parsing
+        :return: dict, where key is outer object, value is list of objects inside it (with itself)
         """
-        outer_objects: list[str] = []
+        outer_objects: dict[str, list[str]] = {}
         previous_key: str = ""
 
-        for key, value in self._objects_to_doc.items():
-            if previous_key == "":
-                outer_objects.append(''.join(value.body))
-                previous_key = key
-            elif not key.startswith(previous_key):
-                outer_objects.append(''.join(value.body))
+        for key in keys:
+            if previous_key == "" or not key.startswith(f"{previous_key}/"):
                 previous_key = key
+                outer_objects[key] = []
+            outer_objects[previous_key].append(key)
 
         return outer_objects
 
-    def get_docs(self) -> dict[str, PosWithDoc]:
+    def _find_copies(self) -> dict[str, list[str]]:
+        """
+        Find pending outer objects with the same normalized code and the same objects to doc inside
+        (copy-pasted helpers, generated accessors) in all files
+        :return: dict, where key is object of the first copy, value is the same objects in other copies
+        """
+        copies: dict[str, list[str]] = {}
+        first_copies: dict[tuple[str, tuple[str, ...]], str] = {}
+
+        for outer_key, keys in self._outer_objects.items():
+            if outer_key not in self._pending_objects:
+                continue
+            suffixes = tuple(key[len(outer_key) :] for key in keys)
+            group = (fingerprint(self._objects_to_doc[outer_key].text), suffixes)
+            first_copy = first_copies.setdefault(group, outer_key)
+            if first_copy == outer_key:
+                continue
+            for key, suffix in zip(keys, suffixes):
+                copies.setdefault(f"{first_copy}{suffix}", []).append(key)
+
+        return copies
+
+    def _with_copies(self, key: str, doc: PosWithDoc) -> Iterator[tuple[str, PosWithDoc]]:
+        """
+        Share documentation of object with the same objects in copies of its code
+        :param key: object to doc
+        :param doc: its doc
+        :return: iterator of pairs of object to doc and its doc
+        """
+        yield key, doc
+        for copy_key in self._copies.get(key, []):
+            value = self._objects_to_doc[copy_key]
+            yield copy_key, PosWithDoc(value.position, doc.Documentation, value.source)
+
+    def _get_outer_objects_to_doc(self) -> dict[str, str]:
+        """
+        get outer objects to doc to don't write double documentation
+        :return: dict, where key is outer object to doc, value is its code
+        """
+        return {
+            key: self._code(key)
+            for key in self._outer_objects
+            if key in self._pending_objects and key not in self._copied
+        }
+
+    def _code(self, key: str) -> str:
+        """
+        Code of object to send to AI, compacted once
+        :param key: object to doc
+        :return: code
+        """
+        if key not in self._codes:
+            body = self._objects_to_doc[key].text
+            code = self._compactor.compact(body) if self._compactor is not None else body
+            self._metrics.add("compaction_bytes_saved", len(body.encode('utf-8')) - len(code.encode('utf-8')))
+            self._codes[key] = code
+        return self._codes[key]
+
+    def _make_batch(self, keys: list[str]) -> Batch:
+        """
+        Make batch of objects and request body for it. Only code of outer objects is sent
+        :param keys: objects of batch in order of parsing
+        :return: batch
+        """
+        outer_keys = list(self._group_outer_objects(keys))
+        objects = {key: self._objects_to_doc[key] for key in keys}
+        return Batch(outer_keys, objects, self._build_body([self._code(key) for key in outer_keys]))
+
+    def _build_body(self, bodies: list[str]) -> RequestBody:
+        """
+        Build body of request to AI
+        :param bodies: code of outer objects
+        :return: json body of request
+        """
+        return {
+            "contents": [
+                {"role": "user", "parts": {"text": self.SYS_INSTRUCTION}},
+                {"role": "user", "parts": [{"text": body} for body in bodies]},
+            ]
+        }
+
+    def _cache_key(self, outer_key: str) -> str:
+        return DocCache.make_key(self._objects_to_doc[outer_key].text, self._model_of_ai, self.SYS_INSTRUCTION_VERSION)
+
+    def _get_docs_from_cache(self) -> dict[str, PosWithDoc]:
+        """
+        Get documentation of outer objects (with all inner objects) found in cache
+        :return: dict, where key object to doc, value is doc
+        """
+        if self._cache is None:
+            return {}
+
+        result: dict[str, PosWithDoc] = {}
+        for outer_key, keys in self._outer_objects.items():
+            cached = self._cache.get(self._cache_key(outer_key))
+            if cached is None or any(key[len(outer_key) :] not in cached for key in keys):
+                continue
+            for key in keys:
+                value = self._objects_to_doc[key]
+                result[key] = PosWithDoc(value.position, cached[key[len(outer_key) :]], value.source)
+
+        return result
+
+    def _put_docs_to_cache(self, documentation: dict[str, PosWithDoc]) -> None:
+        """
+        Save documentation of outer objects, which were fully documented, to cache
+        :param documentation: dict, where key object to doc, value is doc
+        """
+        if self._cache is None:
+            return
+
+        for outer_key, keys in self._outer_objects.items():
+            if outer_key in self._cached_docs or any(key not in documentation for key in keys):
+                continue
+            docs = {key[len(outer_key) :]: documentation[key].Documentation for key in keys}
+            self._cache.put(self._cache_key(outer_key), docs)
+
+    def get_docs(self, on_docs: Callable[[dict[str, PosWithDoc]], None] | None = None) -> dict[str, PosWithDoc]:
         """
         Get documentation for AIRequester
+        :param on_docs: called with documentation as soon as it is received (with cached documentation first)
         :return: dict, where key object to doc, value is doc
         """
+        if on_docs is not None:
+            on_docs(dict(self._cached_docs))
+        if not self._pending_objects:
+            return dict(self._cached_docs)
+
         documentation: dict[str, PosWithDoc] = {}
+        for batch in self._batches:
+            docs = self._get_batch_docs(batch)
+            if on_docs is not None:
+                on_docs(docs)
+            documentation.update(docs)
+
+        return self._merge_docs(documentation)
+
+    def _merge_docs(self, documentation: dict[str, PosWithDoc]) -> dict[str, PosWithDoc]:
+        """
+        Save documentation received from AI to cache and merge it with cached documentation
+        :param documentation: dict, where key object to doc, value is doc
+        :return: dict, where key object to doc, value is doc
+        :raises DocumentationNotReceived: if no object was documented
+        """
+        if not documentation:
+            raise DocumentationNotReceived()
+
+        self._put_docs_to_cache(documentation)
+        return {**self._cached_docs, **documentation}
+
+    def _get_batch_docs(self, batch: Batch) -> dict[str, PosWithDoc]:
+        """
+        Get documentation for one batch. Validated objects are kept, only missing objects are requested again
+        :param batch: batch to doc
+        :return: dict, where key object to doc, value is doc
+        """
+        return dict(self._iter_batch_docs(batch))
+
+    def _iter_batch_docs(self, batch: Batch) -> Iterator[tuple[str, PosWithDoc]]:
+        """
+        Get documentation for one batch as soon as documentation of each object is received.
+        Validated objects are kept, only missing objects are requested again
+        :param batch: batch to doc
+        :return: iterator of pairs of object to doc and its doc
+        """
+        documented: set[str] = set()
         count_of_tries = 0
 
-        while not documentation or count_of_tries < 3:
-            docs = self._get_docs_from_ai()
-            valid_docs = self._validate_docs(docs)
+        while batch.objects and count_of_tries < self.MAX_TRIES:
+            if count_of_tries > 0:
+                self._metrics.add("retries")
             count_of_tries += 1
+            found = False
+            for key, doc in self._iter_docs_from_ai(batch.body, batch.objects):
+                if key not in documented:
+                    documented.add(key)
+                    found = True
+                    yield from self._with_copies(key, doc)
 
-            if valid_docs is not None:
-                documentation = valid_docs
+            if found:
+                batch = self._make_batch([key for key in batch.objects if key not in documented])
 
-        if not documentation:
-            print("Cannot get documentation. Please try again")
-            sys.exit(-1)
+        if batch.objects:
+            self._metrics.add("objects_not_documented", len(batch.objects))
+            print(f"Cannot get documentation for {len(batch.objects)} items after {count_of_tries} tries")
 
-        return documentation
+    def _iter_docs_from_ai(
+        self, body: RequestBody, objects: dict[str, PosWithBody]
+    ) -> Iterator[tuple[str, PosWithDoc]]:
+        """
+        Send one request and get documentation of objects found in answer.
+        Override to get documentation before the whole answer is received
+        :param body: json body of request
+        :param objects: objects of batch
+        :return: iterator of pairs of object to doc and its doc
+        """
+        yield from (self._validate_docs(self._request_docs(body), objects) or {}).items()
+
+    def _request_docs(self, body: RequestBody) -> str | None:
+        """
+        Send request to AI through rate limiter. On 429 waits retryDelay (or backoff) with jitter and retries
+        :param body: json body of request
+        :return: answer of AI or None
+        """
+        return self._send_with_retries(body, self._get_docs_from_ai)
+
+    def _send_with_retries(self, body: RequestBody, send: Callable[[RequestBody], T | None]) -> T | None:
+        """
+        Call send through rate limiter, retrying after RateLimitExceeded
+        :param body: json body of request
+        :param send: function sending request
+        :return: result of send or None
+        """
+        tokens = estimate_tokens(json.dumps(body))
+
+        for attempt in range(1, self.MAX_RATE_LIMIT_TRIES + 1):
+            self._metrics.add("rate_limit_wait_seconds", self._rate_limiter.acquire(tokens))
+            try:
+                return send(body)
+            except RateLimitExceeded as e:
+                self._metrics.add("rate_limited")
+                delay = backoff_delay(attempt, e.retry_delay)
+                print(f"Too many requests. Retrying after {delay:.1f}s")
+                self._rate_limiter.pause(delay)
+
+        print(f"Too many requests. Gave up after {self.MAX_RATE_LIMIT_TRIES} tries")
+        return None
 
     @abstractmethod
-    def _get_docs_from_ai(self) -> str | None:
+    def _get_docs_from_ai(self, body: RequestBody) -> str | None:
         pass
 
     @abstractmethod
-    def _validate_docs(self, docs: str | None) -> dict[str, PosWithDoc] | None:
-        pass
+    def _validate_docs(self, docs: str | None, objects: dict[str, PosWithBody]) -> dict[str, PosWithDoc] | None:
+        """
+        Parse answer of AI
+        :param docs: answer of AI
+        :param objects: objects of batch
+        :return: documentation of objects found in answer (missing objects are not included) or None
+        """
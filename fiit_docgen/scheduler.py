@@ -0,0 +1,129 @@
+import random
+import re
+import threading
+import time
+from typing import Callable
+
+DEFAULT_BACKOFF = 2.0
+MAX_BACKOFF = 120.0
+# Maximal count of requests to AI in flight
+DEFAULT_CONCURRENCY = 4
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised by requester when AI answers 429 Too Many Requests
+    """
+
+    def __init__(self, retry_delay: float | None = None):
+        """
+        :param retry_delay: delay in seconds requested by server (retryDelay) or None
+        """
+        super().__init__(f"Rate limit exceeded, retry after {retry_delay}s")
+        self.retry_delay = retry_delay
+
+
+def parse_retry_delay(value: object) -> float | None:
+    """
+    Parse retryDelay of Google API error ("17s", "1.5s", "300ms")
+    :param value: value of retryDelay
+    :return: delay in seconds or None if value cannot be parsed
+    """
+    if value is None:
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s)?\s*', str(value))
+    if match is None:
+        return None
+    delay = float(match.group(1))
+    return delay / 1000 if match.group(2) == 'ms' else delay
+
+
+def backoff_delay(attempt: int, retry_delay: float | None = None) -> float:
+    """
+    Delay before next try after 429
+    :param attempt: number of try, starting from 1
+    :param retry_delay: delay requested by server
+    :return: requested delay (or exponential backoff, if server did not request it) with jitter
+    """
+    base = retry_delay if retry_delay is not None else min(DEFAULT_BACKOFF * 2 ** (attempt - 1), MAX_BACKOFF)
+    return base + random.uniform(0, max(1.0, base * 0.1))
+
+
+class _Bucket:
+    """Token bucket, refilled continuously with rate per minute"""
+
+    def __init__(self, per_minute: float, now: float):
+        self.rate = per_minute / 60
+        # Burst is limited to 10 seconds of quota to not exceed quota of one minute window
+        self.capacity = max(1.0, per_minute / 6)
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter with token buckets for requests per minute and tokens per minute.
+    It is shared by all threads sending requests, so pending requests wait instead of failing
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Initialize RateLimiter
+        :param requests_per_minute: quota of requests per minute, None - unlimited
+        :param tokens_per_minute: quota of input tokens per minute, None - unlimited
+        :param clock: monotonic clock
+        :param sleep: function to wait
+        """
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        now = clock()
+        self._requests = _Bucket(requests_per_minute, now) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute, now) if tokens_per_minute else None
+        self._paused_until = now
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Wait until request can be sent
+        :param tokens: estimated count of tokens of request
+        :return: time waited in seconds
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                wait = self._paused_until - now
+                for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        wait = max(wait, bucket.wait_time(amount))
+                if wait <= 0:
+                    if self._requests is not None:
+                        self._requests.level -= 1
+                    if self._tokens is not None:
+                        self._tokens.level -= tokens
+                    return waited
+            self._sleep(wait)
+            waited += wait
+
+    def pause(self, delay: float) -> None:
+        """
+        Stop sending of all requests for delay (after 429 from server)
+        :param delay: delay in seconds
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + delay)
@@ -0,0 +1,121 @@
+import codecs
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+
+def atomic_write(path: str | os.PathLike[str], data: bytes, mode: int | None = None) -> None:
+    """
+    Replace file atomically: data is written to temporary file in the same directory, which is renamed over path.
+    Readers never see half-written file, and the file is left intact if writing fails
+    :param path: path to file, its directory is created if needed
+    :param data: new content of file
+    :param mode: permissions of new file, default permissions of temporary file if None
+    """
+    directory, name = os.path.split(os.fspath(path))
+    directory = directory or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class SourceFileChanged(Exception):
+    """
+    Raised on write, if file was changed on disk after it was read
+    """
+
+    def __init__(self, path: str):
+        super().__init__(f"File {path} was changed after it was read")
+        self.path = path
+
+
+class SourceFile:
+    """
+    File of code read once and shared by Parser and CodeChanger.
+    Keeps lines of file, its mtime and hash to refuse writing over changes made after reading
+    """
+
+    def __init__(self, path: str, data: bytes, mtime_ns: int):
+        """
+        Initialize SourceFile from content of file
+        :param path: path to file
+        :param data: content of file
+        :param mtime_ns: modification time of file
+        """
+        self.path = os.path.realpath(path)
+        self.mtime_ns = mtime_ns
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.bom = data.startswith(codecs.BOM_UTF8)
+        # Only file with CRLF endings everywhere is converted. In file with mixed endings lines keep their own
+        # endings, so writing documentation does not rewrite endings of the whole file
+        crlf = data.count(b'\r\n')
+        self.newline = '\r\n' if crlf and crlf == data.count(b'\n') else '\n'
+        text = data.decode('utf-8-sig')
+        if self.newline != '\n':
+            text = text.replace('\r\n', '\n')
+        # Lone \r ends line for ast, so it is replaced to keep numbers of lines the same
+        text = re.sub(r'\r(?!\n)', '\n', text)
+        self.lines = io.StringIO(text).readlines()
+
+    @classmethod
+    def read(cls, path: str) -> 'SourceFile':
+        """
+        Read file
+        :param path: path to file
+        :return: SourceFile
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        return cls(path, data, mtime_ns)
+
+    def is_changed(self) -> bool:
+        """
+        Check if file on disk differs from read one. Hash is compared only if mtime was changed
+        :return: True if file was changed or removed
+        """
+        try:
+            if os.stat(self.path).st_mtime_ns == self.mtime_ns:
+                return False
+            with open(self.path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest() != self.digest
+        except FileNotFoundError:
+            return True
+
+    def encode(self, lines: list[str]) -> bytes:
+        """
+        Encode lines with BOM and line endings of original file
+        :param lines: lines of file
+        :return: content of file
+        """
+        text = ''.join(lines)
+        if self.newline != '\n':
+            text = text.replace('\n', self.newline)
+        return (codecs.BOM_UTF8 if self.bom else b'') + text.encode('utf-8')
+
+    def write(self, lines: list[str]) -> None:
+        """
+        Atomically replace file with lines (through temporary file and rename)
+        :param lines: new lines of file
+        :raises SourceFileChanged: if file was changed after it was read
+        """
+        if self.is_changed():
+            raise SourceFileChanged(self.path)
+
+        data = self.encode(lines)
+        atomic_write(self.path, data, os.stat(self.path).st_mode & 0o7777)
+
+        self.lines = list(lines)
+        self.mtime_ns = os.stat(self.path).st_mtime_ns
+        self.digest = hashlib.sha256(data).hexdigest()
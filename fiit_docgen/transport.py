@@ -0,0 +1,301 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, NamedTuple
+
+from fiit_docgen.batcher import estimate_tokens
+from fiit_docgen.metrics import Metrics
+from fiit_docgen.source import atomic_write
+
+if TYPE_CHECKING:
+    from requests import Response
+
+
+class TransportResponse(NamedTuple):
+    status_code: int
+    body: Any
+
+
+class CassetteMiss(Exception):
+    """
+    Raised by ReplayTransport, if request was not recorded in cassette
+    """
+
+    def __init__(self, key: str):
+        super().__init__(f"Request {key} is not recorded in cassette")
+        self.key = key
+
+
+def request_key(url: str, body: Any) -> str:
+    """
+    Hash of request. Query of url and headers (with API key) are not included, so cassette does not depend on key
+    :param url: url of request
+    :param body: json body of request
+    :return: hex digest
+    """
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(f"{url.split('?', 1)[0]}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+class Transport(ABC):
+    """
+    Sends json requests to AI. Inherit this class to change how requester reaches AI
+    """
+
+    @abstractmethod
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        """
+        Send request
+        :param url: url of request
+        :param body: json body of request
+        :param headers: additional headers of request
+        :return: status code and json body of answer (None if answer is not json)
+        """
+
+    def stream(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        """
+        Send request and receive answer as stream of server-sent events
+        :param url: url of request
+        :param body: json body of request
+        :param headers: additional headers of request
+        :return: status code and iterator of json events (json body of answer, if status code is not 200)
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support streaming")
+
+    def close(self) -> None:
+        pass
+
+
+class HttpTransport(Transport):
+    """
+    Transport through requests.Session, which keeps connections alive between requests
+    """
+
+    def __init__(self, url: str, pool_size: int = 1):
+        """
+        Initialize HttpTransport
+        :param url: base url of AI, connections to it are pooled
+        :param pool_size: count of kept-alive connections
+        """
+        # requests is imported only when AI is called, so runs without network start faster
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+
+        self._session = Session()
+        self._session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        response = self._session.post(url, json=body, headers={"Content-Type": "application/json", **(headers or {})})
+        try:
+            return TransportResponse(response.status_code, response.json())
+        except ValueError:
+            return TransportResponse(response.status_code, None)
+
+    def stream(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        response = self._session.post(
+            url, json=body, headers={"Content-Type": "application/json", **(headers or {})}, stream=True
+        )
+        if response.status_code == 200:
+            return TransportResponse(200, self._events(response))
+        try:
+            return TransportResponse(response.status_code, response.json())
+        except ValueError:
+            return TransportResponse(response.status_code, None)
+        finally:
+            response.close()
+
+    @staticmethod
+    def _events(response: 'Response') -> Iterator[Any]:
+        """Parse server-sent events of answer as they arrive. OpenAI-compatible APIs end stream with [DONE]"""
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('data:') and line[len('data:') :].strip() != '[DONE]':
+                    yield json.loads(line[len('data:') :])
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class MeteredTransport(Transport):
+    """
+    Transport, which records to Metrics duration of every request, status codes and bytes and estimated tokens
+    sent and received. Duration of streaming request is measured until the end of stream
+    """
+
+    def __init__(self, inner: Transport, metrics: Metrics, clock: Callable[[], float] = time.perf_counter):
+        """
+        Initialize MeteredTransport
+        :param inner: transport to send requests
+        :param metrics: metrics of run
+        :param clock: monotonic clock
+        """
+        self._inner = inner
+        self._metrics = metrics
+        self._clock = clock
+
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        start = self._sent(body)
+        response = self._inner.post(url, body, headers)
+        self._received(response.status_code, response.body)
+        self._metrics.observe("http_request", self._clock() - start)
+        return response
+
+    def stream(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        start = self._sent(body)
+        response = self._inner.stream(url, body, headers)
+        if response.status_code != 200:
+            self._received(response.status_code, response.body)
+            self._metrics.observe("http_request", self._clock() - start)
+            return response
+        self._received(200, None)
+        return TransportResponse(200, self._metered_events(response.body, start))
+
+    def _metered_events(self, events: Iterable[Any], start: float) -> Iterator[Any]:
+        try:
+            for event in events:
+                self._add_received_bytes(json.dumps(event))
+                yield event
+        finally:
+            self._metrics.observe("http_request", self._clock() - start)
+
+    def _sent(self, body: Any) -> float:
+        text = json.dumps(body)
+        self._metrics.add("http_requests")
+        self._metrics.add("bytes_sent", len(text.encode('utf-8')))
+        self._metrics.add("tokens_sent", estimate_tokens(text))
+        return self._clock()
+
+    def _received(self, status_code: int, body: Any) -> None:
+        self._metrics.add(f"http_status_{status_code}")
+        if body is not None:
+            self._add_received_bytes(json.dumps(body))
+
+    def _add_received_bytes(self, text: str) -> None:
+        self._metrics.add("bytes_received", len(text.encode('utf-8')))
+        self._metrics.add("tokens_received", estimate_tokens(text))
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+def load_cassette(path: Path) -> dict[str, TransportResponse]:
+    """
+    Read cassette file
+    :param path: path to cassette
+    :return: dict, where key is hash of request, value is answer
+    """
+    data = json.loads(path.read_text(encoding='utf-8'))
+    return {key: TransportResponse(value["status_code"], value["body"]) for key, value in data.items()}
+
+
+class RecordingTransport(Transport):
+    """
+    Transport, which sends requests through other transport and saves pairs request/answer to cassette file.
+    Cassette is rewritten atomically after every answer, so it is usable even if run is interrupted
+    """
+
+    def __init__(self, inner: Transport, path: Path):
+        """
+        Initialize RecordingTransport
+        :param inner: transport to send requests
+        :param path: path to cassette, already recorded answers in it are kept
+        """
+        self._inner = inner
+        self._path = path
+        self._lock = threading.Lock()
+        self._records = load_cassette(path) if path.exists() else {}
+
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        response = self._inner.post(url, body, headers)
+        self._record(url, body, response)
+        return response
+
+    def stream(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        response = self._inner.stream(url, body, headers)
+        if response.status_code != 200:
+            self._record(url, body, response)
+            return response
+        return TransportResponse(200, self._record_events(url, body, response.body))
+
+    def _record_events(self, url: str, body: Any, events: Iterable[Any]) -> Iterator[Any]:
+        """Pass events further and record them, when stream is finished"""
+        received: list[Any] = []
+        for event in events:
+            received.append(event)
+            yield event
+        self._record(url, body, TransportResponse(200, received))
+
+    def _record(self, url: str, body: Any, response: TransportResponse) -> None:
+        with self._lock:
+            self._records[request_key(url, body)] = response
+            self._save()
+
+    def _save(self) -> None:
+        data = {key: response._asdict() for key, response in self._records.items()}
+        atomic_write(self._path, json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Transport, which answers from cassette without network.
+    Latency and 429 answers can be injected to load-test scheduler offline
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        latency: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_delay: float | None = 1.0,
+        seed: int = 0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Initialize ReplayTransport
+        :param path: path to cassette
+        :param latency: delay of every answer in seconds
+        :param rate_limit_rate: share of requests answered with 429 (from 0 to 1)
+        :param retry_delay: retryDelay of injected 429 answers, None - without retryDelay
+        :param seed: seed of random generator of injected 429 answers
+        :param sleep: function to wait
+        """
+        self._records = load_cassette(path)
+        self._latency = latency
+        self._rate_limit_rate = rate_limit_rate
+        self._retry_delay = retry_delay
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def post(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        key = request_key(url, body)
+        with self._lock:
+            self.requests += 1
+            rate_limited = self._random.random() < self._rate_limit_rate
+        if self._latency > 0:
+            self._sleep(self._latency)
+        if rate_limited:
+            return self._rate_limit_response()
+        if key not in self._records:
+            raise CassetteMiss(key)
+        return self._records[key]
+
+    def stream(self, url: str, body: Any, headers: dict[str, str] | None = None) -> TransportResponse:
+        response = self.post(url, body, headers)
+        if response.status_code != 200:
+            return response
+        return TransportResponse(200, iter(response.body))
+
+    def _rate_limit_response(self) -> TransportResponse:
+        """Answer 429 in format of Google API"""
+        details = [] if self._retry_delay is None else [{"retryDelay": f"{self._retry_delay}s"}]
+        error = {"code": 429, "status": "RESOURCE_EXHAUSTED", "details": details}
+        return TransportResponse(429, {"error": error})
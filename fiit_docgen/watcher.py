@@ -0,0 +1,140 @@
+import os
+import time
+from pathlib import Path
+from typing import Callable, Sequence
+
+from fiit_docgen.cache import fingerprint
+from fiit_docgen.project import (
+    DEFAULT_EXCLUDE,
+    DEFAULT_INCLUDE,
+    MIN_FILES_FOR_POOL,
+    find_python_files,
+    parse_files,
+)
+from fiit_docgen.records import PosWithBody
+
+
+class Watcher:
+    """
+    Следит за файлами проекта (опросом mtime). Держит в памяти результаты парсинга каждого файла,
+    при изменениях перепарсивает только измененные файлы и отдает только новые или измененные объекты
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        include: Sequence[str] = DEFAULT_INCLUDE,
+        exclude: Sequence[str] = DEFAULT_EXCLUDE,
+        backend: str = 'ast',
+        regen: bool = False,
+        interval: float = 1.0,
+        debounce: float = 0.5,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        :param root: файл или директория проекта
+        :param include: glob-шаблоны файлов, которые нужно документировать
+        :param exclude: glob-шаблоны файлов и директорий, которые нужно пропустить
+        :param backend: парсер из PARSERS
+        :param regen: искать объекты со сгенерированной документацией вместо недокументированных
+        :param interval: период опроса файлов в секундах
+        :param debounce: время без изменений, после которого изменения обрабатываются одной пачкой
+        :param sleep: функция ожидания
+        """
+        self._root = root
+        self._include = include
+        self._exclude = exclude
+        self._backend = backend
+        self._regen = regen
+        self._interval = interval
+        self._debounce = debounce
+        self._sleep = sleep
+        self._mtimes: dict[str, int] = {}
+        # Для каждого файла: объект -> отпечаток его кода на момент последнего парсинга
+        self._objects: dict[str, dict[str, str]] = {}
+
+    def _files(self) -> list[Path]:
+        if self._root.is_file():
+            return [self._root]
+        return find_python_files(self._root, self._include, self._exclude)
+
+    def _scan(self) -> list[str]:
+        """Находит новые, измененные и удаленные файлы, запоминая их mtime"""
+        changed: list[str] = []
+        current: dict[str, int] = {}
+        for file in self._files():
+            path = os.path.realpath(file)
+            try:
+                current[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if self._mtimes.get(path) != current[path]:
+                changed.append(path)
+
+        for path in self._mtimes.keys() - current.keys():
+            self._objects.pop(path, None)
+        self._mtimes = current
+        return changed
+
+    def _reparse(self, paths: list[str]) -> dict[str, PosWithBody]:
+        """
+        Перепарсивает файлы и сравнивает результат с предыдущим
+        :return: объекты, которых не было при прошлом парсинге или код которых изменился
+        """
+        # Для нескольких файлов запуск пула процессов дольше самого парсинга
+        jobs = None if len(paths) > MIN_FILES_FOR_POOL else 1
+        parsed = parse_files([Path(path) for path in paths], self._regen, jobs, self._backend)
+        by_file: dict[str, dict[str, PosWithBody]] = {path: {} for path in paths}
+        for key, value in parsed.objects.items():
+            if value.source is not None:
+                by_file.setdefault(value.source.path, {})[key] = value
+
+        queued: dict[str, PosWithBody] = {}
+        for path, objects in by_file.items():
+            previous = self._objects.get(path, {})
+            current = {key: fingerprint(value.text) for key, value in objects.items()}
+            queued.update({key: objects[key] for key, digest in current.items() if previous.get(key) != digest})
+            self._objects[path] = current
+        return queued
+
+    def start(self) -> dict[str, PosWithBody]:
+        """
+        Первый полный парсинг
+        :return: все найденные объекты
+        """
+        return self._reparse(self._scan())
+
+    def poll(self) -> dict[str, PosWithBody]:
+        """
+        Проверяет изменения. Пока файлы продолжают меняться, ждет debounce и собирает изменения вместе
+        :return: новые или измененные объекты
+        """
+        changed = set(self._scan())
+        if not changed:
+            return {}
+        while True:
+            self._sleep(self._debounce)
+            more = self._scan()
+            if not more:
+                break
+            changed.update(more)
+        return self._reparse(sorted(changed))
+
+    def run(self, callback: Callable[[dict[str, PosWithBody]], None]) -> None:
+        """
+        Следит за файлами до Ctrl+C, передавая в callback объекты для документирования.
+        Файлы, измененные самим callback, перепарсиваются, но уже документированные объекты в очередь не попадают
+        :param callback: обработчик найденных объектов
+        """
+        queued = self.start()
+        try:
+            while True:
+                if queued:
+                    try:
+                        callback(queued)
+                    except Exception as e:
+                        print(f'Error: {e}')
+                self._sleep(self._interval)
+                queued = self.poll()
+        except KeyboardInterrupt:
+            print('Stopped watching')